@@ -1,7 +1,9 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackQueryHandler
 
-from bot.helpers import reply
+from bot.helpers import edit_reply_markup, reply
+from bot.commands import movement_name_picker
+from bot.keyboards import name_picked, name_picker_markup, name_search_input, resolve_picked_name
 from core.report_manager import ReportManager
 from utils.time_utils import is_valid_24h_time, now_hhmm
 from config.constants import (
@@ -13,8 +15,8 @@ from config.constants import (
 
 # IMPORTANT: import ONLY the real SFT handler
 from core.sft_manager import handle_sft_callbacks
-from services.auth_service import is_admin_user
-from services.auth_service import get_all_admin_user_ids
+from bot.identity import get_identity
+from services.auth_service import list_admin_user_ids
 from utils.rate_limiter import user_rate_limiter
 
 # ==================================================
@@ -85,7 +87,12 @@ async def text_input_router(update, context):
     if not user_rate_limiter.allow(user_id, "text_input_router", max_requests=12, window_seconds=15):
         await reply(update, "⏳ Too many messages in a short time. Please slow down.")
         return
-    
+
+    # A name picker is open: typed text searches it, whatever the mode.
+    if context.user_data.get("awaiting_name"):
+        await name_search_input(update, context)
+        return
+
     mode = context.user_data.get("mode")
 
     if mode == "MOVEMENT":
@@ -237,22 +244,10 @@ async def handle_movement_callbacks(update, context):
     await query.answer()
     data = query.data
 
-    def build_movement_keyboard():
-        names = context.user_data.get("all_names", [])
-        selected = context.user_data.get("selected", set())
-        keyboard = [
-            [
-                InlineKeyboardButton(
-                    f"{'✅' if name in selected else '⬜'} {name}",
-                    callback_data=f"mov:name|{name}",
-                )
-            ]
-            for name in names
-        ]
-        keyboard.append(
-            [InlineKeyboardButton("✅ Done Selecting", callback_data="mov:done")]
-        )
-        return InlineKeyboardMarkup(keyboard)
+    async def build_movement_keyboard():
+        if "name_picker" not in context.user_data:
+            return await movement_name_picker(context)
+        return await name_picker_markup(context)
 
     def build_location_keyboard(prefix: str):
         keyboard = [
@@ -269,15 +264,15 @@ async def handle_movement_callbacks(update, context):
         return InlineKeyboardMarkup(keyboard)
 
     if data.startswith("mov:name|"):
-        _, name = data.split("|", 1)
+        _, token = data.split("|", 1)
+        name = await resolve_picked_name(context, token)
         selected = context.user_data.setdefault("selected", set())
+        # A stale button or a name that left the roster is simply redrawn away.
         if name in selected:
             selected.remove(name)
-        else:
+        elif name is not None:
             selected.add(name)
-        await query.edit_message_reply_markup(
-            reply_markup=build_movement_keyboard()
-        )
+        await edit_reply_markup(update, await build_movement_keyboard())
         return
 
     if data == "mov:done":
@@ -285,6 +280,7 @@ async def handle_movement_callbacks(update, context):
         if not selected:
             await reply(update, "❌ Please select at least one cadet.")
             return
+        name_picked(context)
         context.user_data["awaiting_from"] = True
         await reply(
             update,
@@ -364,7 +360,7 @@ async def handle_movement_callbacks(update, context):
     )
 
     # Notify admins
-    for admin in get_all_admin_user_ids():
+    for admin in await list_admin_user_ids():
         await context.bot.send_message(
             chat_id=admin,
             text="Movement report sent:\n\n" + msg,
@@ -435,8 +431,8 @@ async def movement_text_input(update, context):
     )
 
 
-def _can_send_parade_state(user_id: int | None) -> bool:
-    return is_admin_user(user_id)
+def _can_send_parade_state(identity) -> bool:
+    return identity.is_admin
 
 # ==================================================
 # PARADE STATE CALLBACKS
@@ -445,9 +441,8 @@ async def handle_parade_callbacks(update, context):
     query = update.callback_query
     await query.answer()
 
-    user_id = update.effective_user.id if update.effective_user else None
-    if not _can_send_parade_state(user_id):
-        await query.edit_message_text("❌ You are not authorized to send parade state.")
+    if not _can_send_parade_state(await get_identity(update, context)):
+        await reply(update, "❌ You are not authorized to send parade state.")
         context.user_data.clear()
         return
     
@@ -458,7 +453,7 @@ async def handle_parade_callbacks(update, context):
     chat_id = IC_GROUP_CHAT_ID
 
     if not text and not data == "parade|cancel":
-        await query.edit_message_text("Session expired. Please start again.")
+        await reply(update, "Session expired. Please start again.")
         context.user_data.clear()
         return
 
@@ -468,9 +463,9 @@ async def handle_parade_callbacks(update, context):
             message_thread_id=thread_id,
             text=text
         )
-        await query.edit_message_text("✅ Parade state sent.")
+        await reply(update, "✅ Parade state sent.")
         context.user_data.clear()
 
     elif data == "parade|cancel":
-        await query.edit_message_text("❌ Parade state cancelled.")
+        await reply(update, "❌ Parade state cancelled.")
         context.user_data.clear()
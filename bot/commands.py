@@ -1,22 +1,28 @@
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-import os
-import tempfile
-
-from bot.helpers import reply, parade_state_cancel_button
-from config.constants import ACTIVITIES, MAX_IMPORT_CSV_SIZE_BYTES
-from services.db_service import get_sft_window
-from db.crud import (
+import io
+import logging
+import time
+
+from bot.helpers import edit_message, reply, parade_state_cancel_button, remember_roster
+from config.constants import (
+    IMPORT_PROGRESS_EDIT_INTERVAL,
+    MAX_IMPORT_CSV_SIZE_BYTES,
+)
+from bot.keyboards import SEARCH_HINT, name_picker
+from core.sft_manager import sft_window_keyboard, show_sft_activities
+from db.async_crud import (
+    run_db,
     clear_user_data,
-    get_all_cadet_names,
+    get_roster,
     list_users,
-    get_all_instructor_names,
-    get_user_by_telegram_id
 )
+from db.import_users_csv import iter_import_users
 from services.db_service import SFTService
-from db.import_users_csv import import_users
-from services.auth_service import is_admin_user
+from bot.identity import get_identity
 from utils.rate_limiter import user_rate_limiter
 
+logger = logging.getLogger(__name__)
+
 # =========================
 # START ENTRY POINT
 # =========================
@@ -33,9 +39,9 @@ async def start(update, context):
 # SFT ENTRY POINT
 # =========================
 async def start_sft(update, context):
-    window = get_sft_window()
+    windows = SFTService.open_windows()
 
-    if not window:
+    if not windows:
         await reply(
             update,
             "❌ PT SFT has not been opened by IC yet.\n"
@@ -45,51 +51,32 @@ async def start_sft(update, context):
 
     context.user_data.clear()
     context.user_data["mode"] = "SFT"
-    context.user_data["start"] = window.start
-    context.user_data["end"] = window.end
-    context.user_data["date"] = window.date
 
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                activity,
-                callback_data=f"sft_activity|{activity}"
-            )
-        ]
-        for activity in ACTIVITIES
-    ]
+    if len(windows) == 1:
+        await show_sft_activities(update, context, windows[0])
+        return
 
     await reply(
         update,
-        f"🏋️ *PT SFT Open*\n\n"
-        f"Time: {window.start}-{window.end}\n\n"
-        f"Select activity:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        "🏋️ *PT SFT Open*\n\nSelect SFT window:",
+        reply_markup=sft_window_keyboard(windows),
         parse_mode="Markdown",
     )
 
-async def quit_sft(update, context):
-    telegram_id = update.effective_user.id if update.effective_user else None
-
-    if telegram_id is None:
-        await reply(update, "❌ Unable to identify your account.")
+async def sft_status(update, context):
+    if not await _is_admin(update, context):
+        await reply(update, "❌ You are not authorised.")
         return
 
-    user = get_user_by_telegram_id(telegram_id)
-    if not user:
-        await reply(update, "❌ You are not registered in the system.")
+    windows = SFTService.open_windows()
+    if not windows:
+        await reply(update, "ℹ️ No SFT window is open.")
         return
 
-    removed = SFTService.remove_submission(user.id)
-
-    if removed:
-        await reply(
-            update,
-            "✅ You have quit SFT. All your submitted SFT entries were removed.",
-        )
-        return
-
-    await reply(update, "ℹ️ You currently have no SFT submissions to remove.")
+    await reply(
+        update,
+        "\n\n".join(SFTService.generate_status(window.id) for window in windows),
+    )
 
 async def quit_sft(update, context):
     telegram_id = update.effective_user.id if update.effective_user else None
@@ -98,12 +85,12 @@ async def quit_sft(update, context):
         await reply(update, "❌ Unable to identify your account.")
         return
 
-    user = get_user_by_telegram_id(telegram_id)
+    user = (await get_identity(update, context)).user
     if not user:
         await reply(update, "❌ You are not registered in the system.")
         return
 
-    removed = SFTService.remove_submission(user.id)
+    removed = await run_db(SFTService.remove_submission, user.id)
 
     if removed:
         await reply(
@@ -119,31 +106,24 @@ async def quit_sft(update, context):
 # =========================
 # MOVEMENT ENTRY POINT
 # =========================
+async def movement_name_picker(context):
+    return await name_picker(
+        context,
+        "mov:name",
+        marked="selected",
+        footer=[("✅ Done Selecting", "mov:done")],
+    )
+
 async def start_movement(update, context):
     context.user_data.clear()
     context.user_data["mode"] = "MOVEMENT"
     context.user_data["selected"] = set()
-    names = get_all_cadet_names()
-    context.user_data["all_names"] = names
-
-    keyboard = [
-        [
-            InlineKeyboardButton(
-                f"⬜ {name}",
-                callback_data=f"mov:name|{name}"
-            )
-        ]
-        for name in names
-    ]
-
-    keyboard.append(
-        [InlineKeyboardButton("✅ Done Selecting", callback_data="mov:done")]
-    )
+    remember_roster(context, await get_roster())
 
     await reply(
         update,
-        "🚶 *Movement reporting started*\n\nSelect personnel:",
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        f"🚶 *Movement reporting started*\n\nSelect personnel:\n\n{SEARCH_HINT}",
+        reply_markup=await movement_name_picker(context),
         parse_mode="Markdown",
     )
 
@@ -154,8 +134,7 @@ async def start_movement(update, context):
 async def start_status(update, context):
     """Main menu for RSO/MA/RSI reporting"""
     context.user_data.clear()
-    context.user_data['all_names'] = get_all_cadet_names()
-    context.user_data['all_instructors'] = get_all_instructor_names()
+    remember_roster(context, await get_roster())
 
     keyboard = [
         [InlineKeyboardButton("📋 Report RSO", callback_data="status_menu|report_rso")],
@@ -183,8 +162,7 @@ async def start_parade_state(update, context):
 	context.user_data.clear()
 	context.user_data["mode"] = "PARADE_STATE"
 	
-	user_id = update.effective_user.id if update.effective_user else None
-	if not _is_admin(user_id):
+	if not await _is_admin(update, context):
 		await reply(update, "❌ You are not authorized to generate parade state.")
 		return
 	
@@ -199,8 +177,8 @@ async def start_parade_state(update, context):
 # =========================
 # USER IMPORT (CSV)
 # =========================
-def _is_admin(user_id: int | None) -> bool:
-    return is_admin_user(user_id)
+async def _is_admin(update, context) -> bool:
+    return (await get_identity(update, context)).is_admin
 
 async def _handle_import_csv(update, context, clear_first: bool):
     document = update.message.document if update.message else None
@@ -213,45 +191,100 @@ async def _handle_import_csv(update, context, clear_first: bool):
         return
 
     if clear_first:
-        cleared = clear_user_data()
+        cleared = await clear_user_data()
+        # Drop the cleared submissions from the open SFT windows too.
+        await run_db(SFTService.load)
         await reply(
             update,
             "🧹 Cleared existing data: "
             f"{cleared['users']} users, "
             f"{cleared['medical_events']} medical events, "
-            f"{cleared['medical_statuses']} medical statuses.",
+            f"{cleared['medical_statuses']} medical statuses, "
+            f"{cleared['sft_submissions']} SFT submissions.",
         )
 
-    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as tmp:
-        tmp_path = tmp.name
+    # Parse straight from memory; the upload is capped at MAX_IMPORT_CSV_SIZE_BYTES.
+    buffer = io.BytesIO()
+    file = await context.bot.get_file(document.file_id)
+    await file.download_to_memory(buffer)
+    buffer.seek(0)
 
+    progress_message = await update.message.reply_text("⏳ Importing users...")
+    committed = {}
     try:
-        file = await context.bot.get_file(document.file_id)
-        await file.download_to_drive(tmp_path)
-        try:
-            result = import_users(tmp_path)
-        except ValueError as exc:
-            await reply(update, f"❌ Import failed: {exc}")
-            return
-        except Exception:
-            await reply(update, "❌ Import failed due to an unexpected error.")
-            return
+        result = await _run_import(iter_import_users(buffer), progress_message, committed)
+    except ValueError as exc:
+        await edit_message(progress_message, f"❌ Import failed: {exc}{_committed_note(committed, clear_first)}")
+        return
+    except Exception:
+        logger.exception("User import failed after %s committed row(s)", committed.get("processed", 0))
+        await edit_message(
+            progress_message,
+            f"❌ Import failed due to an unexpected error.{_committed_note(committed, clear_first)}",
+        )
+        return
+
+    await edit_message(progress_message, _format_import_result(result))
+
+
+_IMPORT_ERRORS_SHOWN = 10
+
+
+async def _run_import(chunks, progress_message, committed):
+    """
+    Drive the chunked import on the DB executor, editing one progress message.
+    committed tracks the latest progress, so a failure can say what was already written.
+    """
+    result = None
+    last_edit = time.monotonic()
+    try:
+        while (progress := await run_db(next, chunks, None)) is not None:
+            result = progress
+            committed.update(progress)
+            if time.monotonic() - last_edit >= IMPORT_PROGRESS_EDIT_INTERVAL:
+                last_edit = time.monotonic()
+                text = f"⏳ Importing users... processed {progress['processed']:,}"
+                if progress["estimated_total"] is not None:
+                    text += f" / ~{progress['estimated_total']:,}"
+                await edit_message(progress_message, text)
     finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+        await run_db(chunks.close)
+    return result
 
-    await reply(
-        update,
+
+def _committed_note(committed, cleared: bool):
+    # Earlier chunks stay committed when a later one fails.
+    if committed.get("processed"):
+        note = (
+            f"\n{committed['processed']:,} row(s) were already written "
+            f"(created: {committed['created']:,}, updated: {committed['updated']:,})."
+        )
+    else:
+        note = "\nNo rows were written."
+    if cleared:
+        note += "\nThe previous users were already cleared."
+    return note
+
+
+def _format_import_result(result):
+    errors = result["errors"]
+    lines = [
         "✅ Import complete. "
-        f"Processed: {result['processed']}, "
-        f"created: {result['created']}, "
-        f"updated: {result['updated']}.",
-    )
+        f"Processed: {result['processed']:,}, "
+        f"created: {result['created']:,}, "
+        f"updated: {result['updated']:,}."
+    ]
+    if errors:
+        lines.append(f"\n⚠️ Skipped {len(errors):,} invalid row(s):")
+        lines.extend(f"Line {line}: {message}" for line, message in errors[:_IMPORT_ERRORS_SHOWN])
+        if len(errors) > _IMPORT_ERRORS_SHOWN:
+            lines.append(f"...and {len(errors) - _IMPORT_ERRORS_SHOWN:,} more.")
+    return "\n".join(lines)
 
 
 async def import_user(update, context):
     user_id = update.effective_user.id if update.effective_user else None
-    if not _is_admin(user_id):
+    if not await _is_admin(update, context):
         await reply(update, "❌ You are not authorized to use /import_user.")
         return
 
@@ -276,7 +309,7 @@ async def import_user_document(update, context):
     if context.user_data.get("mode") != "IMPORT_USER":
         return
     user_id = update.effective_user.id if update.effective_user else None
-    if not _is_admin(user_id):
+    if not await _is_admin(update, context):
         await reply(update, "❌ You are not authorized to import users.")
         return
 
@@ -301,7 +334,7 @@ async def import_user_callback(update, context):
         return
     await query.answer()
 
-    if not _is_admin(update.effective_user.id if update.effective_user else None):
+    if not await _is_admin(update, context):
         await reply(update, "❌ You are not authorized to manage imports.")
         return
 
@@ -318,7 +351,7 @@ async def import_user_callback(update, context):
         )
 
     if action == "list":
-        users = list_users()
+        users = await list_users()
         if not users:
             await reply(update, "No users found.")
             return
@@ -1,18 +1,143 @@
+import hashlib
+from collections import Counter, OrderedDict
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from db.async_crud import get_roster
+from db.roster import roster_cache
+
+# Messages whose last sent text/markup we remember; least recently used go first.
+MAX_TRACKED_MESSAGES = 10_000
+
+# (chat_id, message_id) -> (text digest, markup digest)
+_fingerprints: OrderedDict[tuple[int, int], tuple[bytes | None, bytes]] = OrderedDict()
+_edit_counts: Counter[str] = Counter()
+
+
+def _digest(value: str) -> bytes:
+    return hashlib.blake2b(value.encode(), digest_size=8).digest()
+
+
+def _text_digest(text, parse_mode) -> bytes:
+    return _digest(f"{parse_mode}\0{text}")
+
+
+def _markup_digest(reply_markup) -> bytes:
+    return _digest(reply_markup.to_json()) if reply_markup else b""
+
+
+def _message_key(message):
+    if message is None:
+        return None
+    return (message.chat_id, message.message_id)
+
+
+def _remember(key, fingerprint):
+    if key is None:
+        return
+    _fingerprints[key] = fingerprint
+    _fingerprints.move_to_end(key)
+    while len(_fingerprints) > MAX_TRACKED_MESSAGES:
+        _fingerprints.popitem(last=False)
+
+
+def _current(message):
+    """What the message shows now: as we last sent it, else as Telegram reports it."""
+    key = _message_key(message)
+    if key in _fingerprints:
+        return _fingerprints[key]
+    if message is None:
+        return None
+    # Telegram's text has Markdown already applied, so it only compares to plain text.
+    text = getattr(message, "text", None)
+    return (
+        _text_digest(text, None) if text is not None else None,
+        _markup_digest(getattr(message, "reply_markup", None)),
+    )
+
+
+async def _ignore_not_modified(edit, **kwargs):
+    try:
+        return await edit(**kwargs)
+    except BadRequest as exc:
+        if "not modified" not in str(exc).lower():
+            raise
+
+
+async def edit_message(target, text, reply_markup=None, parse_mode=None):
+    """
+    Edit a message, skipping the API call when nothing would change and
+    editing only the buttons when only they changed. target is a callback
+    query or a Message the bot sent.
+    """
+    if hasattr(target, "edit_message_text"):
+        message = target.message
+        edit_text, edit_markup = target.edit_message_text, target.edit_message_reply_markup
+    else:
+        message = target
+        edit_text, edit_markup = target.edit_text, target.edit_reply_markup
+
+    fingerprint = (_text_digest(text, parse_mode), _markup_digest(reply_markup))
+    current = _current(message)
+    key = _message_key(message)
+
+    if current == fingerprint:
+        _edit_counts["skipped"] += 1
+        _remember(key, fingerprint)
+        return
+    if current is not None and current[0] == fingerprint[0]:
+        _edit_counts["markup_only"] += 1
+        await _ignore_not_modified(edit_markup, reply_markup=reply_markup)
+    else:
+        _edit_counts["text"] += 1
+        await _ignore_not_modified(
+            edit_text, text=text, reply_markup=reply_markup, parse_mode=parse_mode
+        )
+    _remember(key, fingerprint)
+
+
+async def edit_reply_markup(update, reply_markup):
+    """Swap only the buttons of the message a callback came from."""
+    query = update.callback_query
+    key = _message_key(query.message)
+    current = _current(query.message)
+    digest = _markup_digest(reply_markup)
+
+    if current is not None and current[1] == digest:
+        _edit_counts["skipped"] += 1
+        return
+    _edit_counts["markup_only"] += 1
+    await _ignore_not_modified(query.edit_message_reply_markup, reply_markup=reply_markup)
+    _remember(key, (current[0] if current else None, digest))
+
+
+def edit_stats() -> dict:
+    return {"tracked": len(_fingerprints), **_edit_counts}
+
 
 async def reply(update, text, reply_markup=None, parse_mode=None):
     if update.message:
-        await update.message.reply_text(
+        sent = await update.message.reply_text(
             text,
             reply_markup=reply_markup,
             parse_mode=parse_mode,
         )
+        _remember(_message_key(sent), (_text_digest(text, parse_mode), _markup_digest(reply_markup)))
     elif update.callback_query:
-        await update.callback_query.edit_message_text(
-            text,
-            reply_markup=reply_markup,
-            parse_mode=parse_mode,
-        )
+        await edit_message(update.callback_query, text, reply_markup, parse_mode)
+
+def remember_roster(context, roster):
+    """Point this session at a shared roster; user_data only keeps its version."""
+    context.user_data["roster_version"] = roster.version
+
+async def session_roster(context):
+    """The roster this session's menu was built from, or the current one if it is gone."""
+    roster = roster_cache.resolve(context.user_data.get("roster_version"))
+    if roster is None:
+        roster = await get_roster()
+        remember_roster(context, roster)
+    return roster
 
 def parade_state_cancel_button():
     keyboard = [[InlineKeyboardButton("❌ Cancel Generation", callback_data="parade|cancel")]] 
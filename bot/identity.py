@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from db.async_crud import get_roster
+from db.roster import RosterEntry
+from services.auth_service import admin_registry
+
+
+@dataclass(frozen=True)
+class Identity:
+    telegram_id: int | None
+    user: RosterEntry | None   # None when the sender is not registered
+    is_admin: bool
+
+
+async def get_identity(update, context) -> Identity:
+    """
+    Who sent this update. Resolved once per update against the shared roster
+    and kept on context, so handlers never query for identity themselves.
+    """
+    identity = getattr(context, "identity", None)
+    if identity is None:
+        sender = update.effective_user if update else None
+        telegram_id = sender.id if sender else None
+        roster = await get_roster()
+        user = roster.by_telegram_id.get(telegram_id)
+        identity = Identity(
+            telegram_id=telegram_id,
+            user=user,
+            is_admin=admin_registry.is_admin(telegram_id, roster),
+        )
+        context.identity = identity
+    return identity
+
+
+async def resolve_identity(update, context):
+    await get_identity(update, context)
+
+
+def register_identity_handler(application):
+    # Group -1 runs ahead of every handler in the default group 0.
+    application.add_handler(TypeHandler(Update, resolve_identity), group=-1)
@@ -0,0 +1,85 @@
+from telegram import InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import InlineQueryHandler
+
+from bot.identity import get_identity
+from config.constants import (
+    INLINE_STATUS_CACHE_SECONDS,
+    INLINE_STATUS_LIMITED_CACHE_SECONDS,
+    INLINE_STATUS_MAX_RESULTS,
+)
+from db.async_crud import get_roster, get_user_parade_statuses, get_users_with_parade_status
+from utils.datetime_utils import now_sg
+from utils.rate_limiter import user_rate_limiter
+
+# =========================
+# INLINE STATUS LOOKUP
+# =========================
+#
+# "@bot <name>" from an instructor lists matching cadets with their open MA/
+# RSO/RSI events and active statuses. Everything is answered from the roster
+# index and the parade state aggregate in memory; an empty query lists the
+# cadets who currently have something open.
+
+
+def _status_lines(status) -> list[str]:
+    lines = []
+    for event in status.events:
+        when = event.event_datetime.strftime("%d%m%y %H%M") + "H"
+        if event.event_type == "MA":
+            place = f" @ {event.location}" if event.location else ""
+            lines.append(f"MA pending: {event.appointment_type or 'appointment'}{place}, {when}")
+        else:
+            lines.append(f"{event.event_type} undiagnosed: {event.symptoms or '-'} ({when})")
+    for entry in status.statuses:
+        lines.append(
+            f"{entry.status_type}: {entry.start_date.strftime('%d%m%y')}-{entry.end_date.strftime('%d%m%y')}"
+        )
+    return lines
+
+
+def _result(entry, status) -> InlineQueryResultArticle:
+    lines = _status_lines(status)
+    summary = "; ".join(lines) if lines else "🟢 No open status"
+    return InlineQueryResultArticle(
+        id=str(entry.id),
+        title=entry.display_name,
+        description=summary,
+        input_message_content=InputTextMessageContent(
+            "\n".join([entry.display_name, *(lines or ["🟢 No open status"])])
+        ),
+    )
+
+
+async def inline_status_query(update, context):
+    query = update.inline_query
+    identity = await get_identity(update, context)
+    user = identity.user
+    if not (identity.is_admin or (user and user.role.lower() == "instructor")):
+        await query.answer([], cache_time=INLINE_STATUS_CACHE_SECONDS, is_personal=True)
+        return
+
+    if not user_rate_limiter.allow(identity.telegram_id, "inline_status", max_requests=30, window_seconds=30):
+        # Answer anyway, or the client spins until Telegram gives up.
+        await query.answer([], cache_time=INLINE_STATUS_LIMITED_CACHE_SECONDS, is_personal=True)
+        return
+
+    today = now_sg().date()
+    roster = await get_roster()
+    text = query.query.strip()
+    if text:
+        cadets = roster.cadet_index.search(text)
+    else:
+        with_status = await get_users_with_parade_status(today)
+        cadets = tuple(entry for entry in roster.cadets if entry.id in with_status)
+    cadets = cadets[:INLINE_STATUS_MAX_RESULTS]
+
+    statuses = await get_user_parade_statuses([entry.id for entry in cadets], today)
+    await query.answer(
+        [_result(entry, statuses[entry.id]) for entry in cadets],
+        cache_time=INLINE_STATUS_CACHE_SECONDS,
+        is_personal=True,
+    )
+
+
+def register_inline_status_handler(application):
+    application.add_handler(InlineQueryHandler(inline_status_query))
@@ -0,0 +1,170 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.helpers import edit_reply_markup, reply, session_roster
+from config.constants import NAME_PAGE_SIZE
+from db.roster import roster_cache
+from utils.rate_limiter import user_rate_limiter
+
+# =========================
+# PAGED NAME PICKERS
+# =========================
+#
+# Buttons carry "<prefix>|<token>|<user id>" instead of the full "RANK NAME",
+# so callback data stays far below Telegram's 64-byte limit, and each message
+# holds one page of the roster instead of the whole intake. How to redraw
+# the picker lives in user_data["name_picker"], so "namepage|<token>|<n>"
+# can turn pages for any flow. Each picker message gets a new token, and
+# taps on older messages are turned away rather than redrawn with newer
+# state. Ids only resolve through the roster version the picker was drawn
+# from: user ids are reused after a clear and reimport. While
+# user_data["awaiting_name"] is set, typed text narrows the picker through
+# the roster's prefix index instead.
+
+PICKER_GROUPS = {
+    "cadets": lambda roster: roster.cadet_index,
+    "instructors": lambda roster: roster.instructor_index,
+}
+
+SEARCH_HINT = "Or type part of a name to search."
+
+
+async def name_picker(context, prefix: str, group: str = "cadets", marked: str | None = None, footer=()):
+    """
+    Start a picker over a roster group and return its first page.
+    marked names a user_data set of display names to show as ticked;
+    footer is (text, callback_data) buttons placed under the names.
+    """
+    context.user_data["name_picker"] = {
+        "token": _next_token(context),
+        "prefix": prefix,
+        "group": group,
+        "marked": marked,
+        "footer": tuple(footer),
+        "page": 0,
+        "query": "",
+    }
+    context.user_data["awaiting_name"] = True
+    return await name_picker_markup(context)
+
+
+def _next_token(context) -> int:
+    previous = context.user_data.get("name_picker") or {}
+    return (previous.get("token", 0) + 1) % 1000
+
+
+def name_picked(context):
+    """Stop treating typed text as a name search."""
+    context.user_data.pop("awaiting_name", None)
+
+
+async def name_picker_markup(context) -> InlineKeyboardMarkup:
+    """The current page of this session's picker."""
+    picker = context.user_data["name_picker"]
+    roster = await session_roster(context)
+    picker["roster_version"] = roster.version
+    index = PICKER_GROUPS[picker["group"]](roster)
+    entries = index.search(picker.get("query", ""))
+
+    pages = max(1, -(-len(entries) // NAME_PAGE_SIZE))
+    page = min(picker["page"], pages - 1)
+    picker["page"] = page
+
+    token = picker.get("token", 0)
+    marked = context.user_data.get(picker["marked"], ()) if picker["marked"] else None
+    keyboard = []
+    for entry in entries[page * NAME_PAGE_SIZE:(page + 1) * NAME_PAGE_SIZE]:
+        text = entry.display_name
+        if marked is not None:
+            text = f"{'✅' if text in marked else '⬜'} {text}"
+        keyboard.append([InlineKeyboardButton(text, callback_data=f"{picker['prefix']}|{token}|{entry.id}")])
+
+    nav_data = f"namepage|{token}"
+    if pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"{nav_data}|{page - 1}"))
+        nav.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f"{nav_data}|{page}"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"{nav_data}|{page + 1}"))
+        keyboard.append(nav)
+
+    if picker.get("query"):
+        keyboard.append([InlineKeyboardButton("✖️ Clear search", callback_data=f"{nav_data}|clear")])
+    for text, data in picker["footer"]:
+        keyboard.append([InlineKeyboardButton(text, callback_data=data)])
+
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def name_page_handler(update, context):
+    query = update.callback_query
+    user_id = update.effective_user.id if update.effective_user else None
+    if not user_rate_limiter.allow(user_id, "callback_router", max_requests=25, window_seconds=10):
+        await query.answer("Too many requests. Please slow down.", show_alert=False)
+        return
+
+    picker = context.user_data.get("name_picker")
+    if not picker:
+        await query.answer("This list has expired. Please start again.", show_alert=True)
+        return
+
+    parts = query.data.split("|")
+    if len(parts) != 3 or parts[1] != str(picker.get("token", 0)):
+        await query.answer("This list is out of date. Please use the latest one.", show_alert=True)
+        return
+
+    await query.answer()
+    choice = parts[2]
+    if choice == "clear":
+        picker["query"] = ""
+        picker["page"] = 0
+    else:
+        page = int(choice)
+        if page == picker["page"]:
+            return
+        picker["page"] = page
+    # Only the buttons change, so leave the message text alone.
+    await edit_reply_markup(update, await name_picker_markup(context))
+
+
+async def name_search_input(update, context):
+    """Typed text while a picker is open: show the names it matches."""
+    picker = context.user_data.get("name_picker")
+    if not picker:
+        name_picked(context)
+        return
+
+    query = update.message.text.strip()[:64]
+    picker["query"] = query
+    picker["page"] = 0
+    # The results go out as a new message; the previous one goes stale.
+    picker["token"] = _next_token(context)
+
+    markup = await name_picker_markup(context)
+    index = PICKER_GROUPS[picker["group"]](await session_roster(context))
+    count = len(index.search(query))
+    if count:
+        text = f"🔎 {count} match(es) for \"{query}\". Tap a name, or type again to refine."
+    else:
+        text = f"🔎 No names match \"{query}\". Type again, or clear the search."
+    await reply(update, text, reply_markup=markup)
+
+
+async def resolve_picked_name(context, token: str) -> str | None:
+    """
+    The display name behind a picker button's "<token>|<user id>", or None
+    if the button is not from the current picker or its roster is gone.
+    Buttons from before ids were used carry the name itself.
+    """
+    picker_token, sep, user_id = token.partition("|")
+    if not sep:
+        return None if token.isdigit() else token
+
+    picker = context.user_data.get("name_picker") or {}
+    if picker_token != str(picker.get("token", 0)) or not user_id.isdigit():
+        return None
+    roster = roster_cache.resolve(picker.get("roster_version"))
+    if roster is None:
+        return None
+    entry = roster.by_id.get(int(user_id))
+    return entry.display_name if entry is not None else None
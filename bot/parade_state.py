@@ -1,67 +1,36 @@
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from db import crud
+from db import async_crud
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from bot.helpers import parade_state_cancel_button
 
-def categorise_medical_events(events):
-	"""Categorise medical events as MA, RSO or RSI"""
-	ma_events = []
-	rso_events = []
-	rsi_events = []
-
-	for event in events:
-		if event[0].event_type == "MA":
-			ma_events.append(event)
-		elif event[0].event_type == "RSO":
-			rso_events.append(event)
-		elif event[0].event_type == "RSI":
-			rsi_events.append(event)
-		else:
-			print("Unsupported event_type. Only RSO, RSI or MA.")
-
-	categorised_medical_events = {"ma": ma_events, "rso": rso_events, "rsi": rsi_events}
-	return categorised_medical_events
-
 def categorise_medical_statuses(statuses):
-	"""Categorise medical statuses as MC, LD, EUL or RMJ"""
-	mc_statuses = []
-	ld_statuses = []
-	eul_statuses = []
-	rmj_statuses = []
-
-	for status in statuses:
-		if status[0].status_type == "MC":
-			mc_statuses.append(status)
-		elif status[0].status_type == "LD":
-			ld_statuses.append(status)
-		elif status[0].status_type == "EUL":
-			eul_statuses.append(status)
-		elif status[0].status_type == "RMJ":
-			rmj_statuses.append(status)
+	"""Categorise medical statuses (keyed by status_type) as MC, LD, EUL or RMJ"""
+	categorised_medical_statuses = {"mc": [], "ld": [], "eul": [], "rmj": []}
+
+	for status_type, entries in statuses.items():
+		key = status_type.lower()
+		if key in categorised_medical_statuses:
+			categorised_medical_statuses[key].extend(entries)
 		else:
 			print("Unsupported event_type. Only MC, LD, EUL or RMJ.")
 
-	categorised_medical_statuses = {"mc": mc_statuses, "ld": ld_statuses, "eul": eul_statuses, "rmj": rmj_statuses}
 	return categorised_medical_statuses
 
 def format_ma(events):
 	"""Format MA events for parade state"""
 	final_text = ""
 	for i, event in enumerate(events):
-		medical_event = event[0]
-		user = event[1]
-
-		if medical_event.endorsed_by is None:
+		if event.endorsed_by is None:
 			endorsed_by = ""
 		else:
-			endorsed_by = medical_event.endorsed_by
+			endorsed_by = event.endorsed_by
 
-		final_text += f"""{i+1}. {user.rank} {user.full_name}
-a. NAME: {medical_event.appointment_type}
-LOCATION: {medical_event.location}
-DATE: {medical_event.event_datetime.strftime("%d%m%y")}
-TIME OF APPOINTMENT: {medical_event.event_datetime.strftime("%H%M")}
+		final_text += f"""{i+1}. {event.rank} {event.full_name}
+a. NAME: {event.appointment_type}
+LOCATION: {event.location}
+DATE: {event.event_datetime.strftime("%d%m%y")}
+TIME OF APPOINTMENT: {event.event_datetime.strftime("%H%M")}
 ENDORSED BY: {endorsed_by}
 
 """
@@ -71,11 +40,8 @@ def format_rso_rsi(events):
 	"""Format RSO and RSI events for parade state"""
 	final_text = ""
 	for i, event in enumerate(events):
-		medical_event = event[0]
-		user = event[1]
-
-		final_text += f"""{i+1}. {user.rank} {user.full_name}
-SYMPTOMS: {medical_event.symptoms}
+		final_text += f"""{i+1}. {event.rank} {event.full_name}
+SYMPTOMS: {event.symptoms}
 DIAGNOSIS: 
 STATUS: 
 
@@ -86,19 +52,15 @@ def format_status(statuses):
 	"""Format statuses for parade state"""
 	final_text = ""
 	for i, status in enumerate(statuses):
-		medical_status = status[0]
-		user = status[1]
-		medical_event = status[2]
-
-		status_start = medical_status.start_date
-		status_end = medical_status.end_date
+		status_start = status.start_date
+		status_end = status.end_date
 		status_duration = status_end - status_start + timedelta(days=1)
 
 		status_start_date = status_start.strftime("%d%m%y")
 		status_end_date = status_end.strftime("%d%m%y")
 		status_duration_days = status_duration.days
 
-		status_type = medical_status.status_type
+		status_type = status.status_type
 		if status_type == "LD":
 			status_type = "LIGHT DUTY"
 		elif status_type == "EUL":
@@ -106,9 +68,9 @@ def format_status(statuses):
 		elif status_type == "RMJ":
 			status_type = "EXCUSED RUNNING, MARCHING, JUMPING"
 
-		final_text += f"""{i+1}. {user.rank} {user.full_name}
-SYMPTOMS: {medical_event.symptoms}
-DIAGNOSIS: {medical_event.diagnosis}
+		final_text += f"""{i+1}. {status.rank} {status.full_name}
+SYMPTOMS: {status.symptoms}
+DIAGNOSIS: {status.diagnosis}
 STATUS: {status_duration_days} DAY(S) {status_type} ({status_start_date}-{status_end_date})
 
 """
@@ -129,16 +91,24 @@ async def generate_parade_state(update, context):
 	current_time = current_datetime.time()
 	current_date = current_datetime.date()
 
-	all_medical_events = crud.get_medical_events()
-	all_medical_statuses = crud.get_active_statuses(current_date.strftime('%Y-%m-%d'))
-	all_cadets = crud.get_all_cadets()
-	active_medical_events = [item for item in all_medical_events if item[0].diagnosis == "" or item[0].diagnosis == None]
-	categorised_medical_events = categorise_medical_events(active_medical_events)
-	categorised_medical_statuses = categorise_medical_statuses(all_medical_statuses)
+	out_of_camp = update.message.text.strip()
+	if not out_of_camp.isdigit():
+		await update.message.reply_text("❌ Only digits are allowed.\n\nPlease input the number of out-of-camp personnel:", reply_markup=parade_state_cancel_button())
+		return
+	out_of_camp = int(out_of_camp)
 
-	ma_events = categorised_medical_events["ma"]
-	rso_events = categorised_medical_events["rso"]
-	rsi_events = categorised_medical_events["rsi"]
+	# Kept current by every medical write, so this is only a render of what is there
+	snapshot = await async_crud.get_parade_snapshot(current_date)
+	total_strength = snapshot.total_strength
+	if out_of_camp > total_strength:
+		await update.message.reply_text("❌ Number of personnel cannot be greater than total strength.\n\nPlease input the number of out-of-camp personnel:", reply_markup=parade_state_cancel_button())
+		return
+
+	categorised_medical_statuses = categorise_medical_statuses(snapshot.statuses)
+
+	ma_events = snapshot.events.get("MA", [])
+	rso_events = snapshot.events.get("RSO", [])
+	rsi_events = snapshot.events.get("RSI", [])
 	mc_statuses = categorised_medical_statuses["mc"]
 	temp_statuses = {key: value for key, value in categorised_medical_statuses.items() if key != "mc"}
 
@@ -177,15 +147,6 @@ async def generate_parade_state(update, context):
 	others_text = perm_status_text = ""
 	others_count = perm_status_count = 0
 	
-	total_strength = len(all_cadets)
-	out_of_camp = update.message.text.strip()
-	if not out_of_camp.isdigit():
-		await update.message.reply_text("❌ Only digits are allowed.\n\nPlease input the number of out-of-camp personnel:", reply_markup=parade_state_cancel_button())
-		return
-	out_of_camp = int(out_of_camp)
-	if out_of_camp > total_strength:
-		await update.message.reply_text("❌ Number of personnel cannot be greater than total strength.\n\nPlease input the number of out-of-camp personnel:", reply_markup=parade_state_cancel_button())
-		return
 	current_strength = total_strength - out_of_camp
 	
 	ma_section = "\n" + ma_text.rstrip() if ma_text else ""
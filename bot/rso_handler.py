@@ -4,21 +4,19 @@ from telegram.ext import CallbackContext
 
 
 
-from db.crud import (
+from db import crud
+from db.database import session_scope
+from db.async_crud import (
+    run_db,
     get_user_records,
-    update_user_record,
-    create_user_record,
     get_ma_records,
     create_ma_record,
     update_ma_record,
     get_user_rsi_records,
-    create_rsi_record,
-    update_rsi_record,
-    get_all_cadet_names,
-    get_all_instructor_names,
 )
 
 from bot.helpers import reply
+from bot.keyboards import SEARCH_HINT, name_picked, name_picker, resolve_picked_name
 
 from config.constants import IC_GROUP_CHAT_ID, PARADE_STATE_TOPIC_ID, CADET_CHAT_ID
 
@@ -29,7 +27,7 @@ def set_mode(context: CallbackContext, mode: str):
 
 
 def reset_entry_state(context: CallbackContext):
-    keep_keys = {"all_names", "all_instructors", "pending_reports", "mode"}
+    keep_keys = {"roster_version", "pending_reports", "mode"}
     preserved = {
         key: value
         for key, value in context.user_data.items()
@@ -97,52 +95,53 @@ def format_pending_reports(reports: list[dict], mode: str) -> str:
 
 
 def persist_pending_reports(reports: list[dict]):
-    for report in reports:
-        mode = report.get("mode")
-        if mode == "report":
-            create_user_record(
-                name=report.get("name", ""),
-                symptoms=report.get("symptoms", ""),
-                diagnosis=report.get("diagnosis", ""),
-            )
-        elif mode == "update":
-            update_user_record(
-                record_id=report.get("record_id"),
-                symptoms=report.get("symptoms", ""),
-                diagnosis=report.get("diagnosis", ""),
-                status=report.get("status", ""),
-                start_date=report.get("start_date", ""),
-                end_date=report.get("end_date", ""),
-            )
-        elif mode == "rsi_report":
-            create_rsi_record(
-                name=report.get("name", ""),
-                symptoms=report.get("symptoms", ""),
-                diagnosis=report.get("diagnosis", ""),
-            )
-        elif mode == "rsi_update":
-            update_rsi_record(
-                record_id=report.get("record_id"),
-                diagnosis=report.get("diagnosis", ""),
-                status_type=report.get("status_type", "MC"),
-                status=report.get("status", ""),
-                start_date=report.get("start_date", ""),
-                end_date=report.get("end_date", ""),
-            )
+    """Blocking; run through run_db. The whole batch is written in one commit."""
+    with session_scope() as session:
+        for report in reports:
+            mode = report.get("mode")
+            if mode == "report":
+                crud.create_user_record(
+                    name=report.get("name", ""),
+                    symptoms=report.get("symptoms", ""),
+                    diagnosis=report.get("diagnosis", ""),
+                    session=session,
+                )
+            elif mode == "update":
+                crud.update_user_record(
+                    record_id=report.get("record_id"),
+                    symptoms=report.get("symptoms", ""),
+                    diagnosis=report.get("diagnosis", ""),
+                    status=report.get("status", ""),
+                    start_date=report.get("start_date", ""),
+                    end_date=report.get("end_date", ""),
+                    session=session,
+                )
+            elif mode == "rsi_report":
+                crud.create_rsi_record(
+                    name=report.get("name", ""),
+                    symptoms=report.get("symptoms", ""),
+                    diagnosis=report.get("diagnosis", ""),
+                    session=session,
+                )
+            elif mode == "rsi_update":
+                crud.update_rsi_record(
+                    record_id=report.get("record_id"),
+                    diagnosis=report.get("diagnosis", ""),
+                    status_type=report.get("status_type", "MC"),
+                    status=report.get("status", ""),
+                    start_date=report.get("start_date", ""),
+                    end_date=report.get("end_date", ""),
+                    session=session,
+                )
 
 
-def make_name_keyboard(context, prefix: str) -> InlineKeyboardMarkup:
-    names = context.user_data.get('all_names', [])
-    keyboard = [
-        [InlineKeyboardButton(name, callback_data=f"{prefix}|{name}")]
-        for name in names
-    ]
-    return InlineKeyboardMarkup(keyboard)
+async def make_name_keyboard(context, prefix: str) -> InlineKeyboardMarkup:
+    return await name_picker(context, prefix)
 
 
 async def prompt_name_selection(update: Update, context: CallbackContext, mode: str, prompt: str, prefix: str):
     set_mode(context, mode)
-    await reply(update, prompt, reply_markup=make_name_keyboard(context, prefix))
+    await reply(update, f"{prompt}\n\n{SEARCH_HINT}", reply_markup=await make_name_keyboard(context, prefix))
 
 
 async def send_to_ic_group(update: Update, context: CallbackContext, message: str):
@@ -164,7 +163,12 @@ async def send_to_cadet_chat(update: Update, context: CallbackContext, message:
 async def name_selection_handler(update: Update, context: CallbackContext):  # manual input for symptoms
     query = update.callback_query
     await query.answer()
-    key, name = query.data.split("|", 1)
+    key, token = query.data.split("|", 1)
+    name = await resolve_picked_name(context, token)
+    if name is None:
+        await reply(update, "❌ That list is out of date. Please start again.")
+        return
+    name_picked(context)
 
     if key == "name" and context.user_data.get("mode") == "report":
         # Check for duplicate cadets in batch for new RSO reports
@@ -204,7 +208,7 @@ async def name_selection_handler(update: Update, context: CallbackContext):  # m
         context.user_data["updating"] = True
         context.user_data["awaiting_diagnosis"] = True
 
-        records = get_user_records(name)
+        records = await get_user_records(name)
         if not records:
             await reply(
                 update,
@@ -237,7 +241,7 @@ async def name_selection_handler(update: Update, context: CallbackContext):  # m
 
     if key == "update_ma_name":
         context.user_data["name"] = name
-        user_records = get_ma_records(name)
+        user_records = await get_ma_records(name)
         if not user_records:
             await reply(update, f"No existing MA reports found for {name}.")
             context.user_data.clear()
@@ -259,17 +263,16 @@ async def name_selection_handler(update: Update, context: CallbackContext):  # m
 
         context.user_data["record_id"] = getattr(latest_record, "id", None)
 
-        instructors = get_all_instructor_names()
-        keyboard = [
-            [InlineKeyboardButton(instructor, callback_data=f"instructor|{instructor}")]
-            for instructor in instructors
-        ]
-        await reply(update, "Select who endorsed:", reply_markup=InlineKeyboardMarkup(keyboard))
+        await reply(
+            update,
+            f"Select who endorsed:\n\n{SEARCH_HINT}",
+            reply_markup=await name_picker(context, "instructor", group="instructors"),
+        )
         return
 
     if key == "rsi_update_name":
         context.user_data["name"] = name
-        records = get_user_rsi_records(name)
+        records = await get_user_rsi_records(name)
         if not records:
             await reply(update, f"No existing RSI report found for {name}.")
             context.user_data.clear()
@@ -722,7 +725,7 @@ async def send_batch_to_ic_handler(update: Update, context: CallbackContext):
         return
 
 
-    persist_pending_reports(reports)
+    await run_db(persist_pending_reports, reports)
     await send_to_ic_group(update, context, summary)
     context.user_data.clear()
     await reply(update, "✅ Sent to IC group.")
@@ -794,7 +797,7 @@ async def confirm_ma_handler(update: Update, context: CallbackContext):
     appointment_time = context.user_data.get('appointment_time', 'N/A')
 
     # Save new MA report to database
-    create_ma_record(
+    await create_ma_record(
         name=name,
         appointment=appointment,
         appointment_location=appointment_location,
@@ -827,7 +830,12 @@ async def update_endorsed(update: Update, context: CallbackContext):
 async def instructor_selection_handler(update: Update, context: CallbackContext):
     query = update.callback_query
     await query.answer()
-    key, instructor = query.data.split("|")
+    key, token = query.data.split("|", 1)
+    instructor = await resolve_picked_name(context, token)
+    if instructor is None:
+        await reply(update, "❌ That list is out of date. Please start again.")
+        return
+    name_picked(context)
     if key == "instructor":
         context.user_data['instructor'] = instructor
         await show_ma_update_summary(update, context)
@@ -875,7 +883,7 @@ async def confirm_ma_update_handler(update: Update, context: CallbackContext):
     instructor = context.user_data.get('instructor', 'N/A')
 
     # Update MA record in database
-    update_ma_record(
+    await update_ma_record(
         record_id=context.user_data.get('record_id'),
         appointment=appointment,
         appointment_location=appointment_location,
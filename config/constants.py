@@ -60,6 +60,34 @@ ACTIVITIES = [
     "Badminton @ Basketball court"
 ]
 
+# SFT windows are split into slots of this many minutes
+SFT_SLOT_MINUTES = 15
+
+# Each activity needs at least this many cadets for the summary
+SFT_MIN_PARTICIPANTS = 2
+
+
+# =========================
+# NAME KEYBOARDS
+# =========================
+
+# Names per page in roster pickers; Prev/Next buttons page through the rest
+NAME_PAGE_SIZE = 20
+
+
+# =========================
+# INLINE STATUS LOOKUP
+# =========================
+
+# Seconds Telegram may cache an inline status answer (per instructor)
+INLINE_STATUS_CACHE_SECONDS = 30
+
+# Seconds Telegram may cache the empty answer sent to a rate-limited instructor
+INLINE_STATUS_LIMITED_CACHE_SECONDS = 5
+
+# Most cadets returned for one inline query (Telegram allows 50)
+INLINE_STATUS_MAX_RESULTS = 20
+
 
 # =========================
 # PARADE STATE CONFIG
@@ -151,8 +179,42 @@ CET_KEYWORDS = [
 # SECURITY LIMITS
 # =========================
 
-# Maximum upload size for /import_user CSV uploads (1 MB)
-MAX_IMPORT_CSV_SIZE_BYTES = 1 * 1024 * 1024
+# Seconds between checks of the cached admin set against the DB (0 disables)
+ADMIN_RECONCILE_INTERVAL_SECONDS = int(os.getenv("ADMIN_RECONCILE_INTERVAL_SECONDS", "3600"))
+
+# Maximum upload size for /import_user CSV uploads (10 MB)
+MAX_IMPORT_CSV_SIZE_BYTES = 10 * 1024 * 1024
+
+# Rows written per transaction during a streaming /import_user import
+IMPORT_CSV_CHUNK_SIZE = 500
+
+# Minimum seconds between edits of the import progress message
+IMPORT_PROGRESS_EDIT_INTERVAL = 2.0
+
+
+# =========================
+# UPDATE HANDLING
+# =========================
+
+# Updates handled at once, so one slow DB write doesn't hold up everyone else
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
+
+# =========================
+# PERSISTENCE
+# =========================
+
+# Seconds between flushes of changed user_data to state.db (also flushed on shutdown)
+PERSISTENCE_UPDATE_INTERVAL_SECONDS = 30
+
+# Persisted user_data keys unchanged for longer than this are not restored
+USER_DATA_TTL_SECONDS = 24 * 60 * 60
+
+# Per-key overrides of USER_DATA_TTL_SECONDS
+USER_DATA_KEY_TTL_SECONDS = {
+    "generated_text": 60 * 60,        # parade state preview awaiting send
+    "pending_sft_summary": 60 * 60,   # PT admin SFT report awaiting send
+}
 
 
 # =========================
@@ -4,6 +4,7 @@ import re
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from bot.helpers import reply
+from bot.keyboards import name_picked, name_picker, name_picker_markup, resolve_picked_name
 from config.constants import IC_GROUP_CHAT_ID, MOVEMENT_TOPIC_ID, LOCATIONS
 
 SG_TZ = pytz.timezone("Asia/Singapore")
@@ -25,26 +26,25 @@ async def handle_movement_callback(update, context):
     # NAME TOGGLE
     # ------------------------------
     if data.startswith("move_name|"):
-        name = data.split("|", 1)[1]
+        name = await resolve_picked_name(context, data.split("|", 1)[1])
         selected = context.user_data.setdefault("selected", set())
 
         if name in selected:
             selected.remove(name)
-        else:
+        elif name is not None:
             selected.add(name)
 
-        keyboard = []
-        for n in context.user_data["all_names"]:
-            prefix = "☑️" if n in selected else "⬜"
-            keyboard.append(
-                [InlineKeyboardButton(f"{prefix} {n}", callback_data=f"move_name|{n}")]
+        if context.user_data.get("name_picker", {}).get("prefix") == "move_name":
+            keyboard = await name_picker_markup(context)
+        else:
+            keyboard = await name_picker(
+                context,
+                "move_name",
+                marked="selected",
+                footer=[("✅ Done Selecting", "move_done")],
             )
 
-        keyboard.append(
-            [InlineKeyboardButton("✅ Done Selecting", callback_data="move_done")]
-        )
-
-        await reply(update, "Select personnel moving:", InlineKeyboardMarkup(keyboard))
+        await reply(update, "Select personnel moving:", keyboard)
 
     # ------------------------------
     # DONE SELECTING
@@ -53,6 +53,7 @@ async def handle_movement_callback(update, context):
         if not context.user_data.get("selected"):
             await query.answer("Select at least one name!", show_alert=True)
             return
+        name_picked(context)
 
         keyboard = [
             [InlineKeyboardButton(loc, callback_data=f"move_from|{loc}")]
@@ -3,12 +3,16 @@ from datetime import datetime
 
 import pytz
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-
-from bot.helpers import reply
-from config.constants import IC_GROUP_CHAT_ID, SFT_TOPIC_ID
-from db.crud import get_all_instructor_names
-from services.db_service import SFTService, set_sft_window
-from services.auth_service import is_admin_user
+from telegram.helpers import escape_markdown
+
+from bot.helpers import remember_roster, reply
+from bot.keyboards import SEARCH_HINT, name_picked, name_picker, resolve_picked_name
+from config.constants import IC_GROUP_CHAT_ID, SFT_MIN_PARTICIPANTS, SFT_TOPIC_ID
+from db.async_crud import get_roster, run_db
+from services.db_service import SFTService, open_sft_window
+from services.sft_matching import apply_proposal, propose_matches
+from core.sft_manager import slot_table
+from bot.identity import get_identity
 from utils.rate_limiter import user_rate_limiter
 
 
@@ -39,17 +43,110 @@ def _valid_time_range(text: str):
 
     return start, end
 
+def _parse_window_input(text: str):
+    """
+    Expects HHMM-HHMM, optionally followed by a label (e.g. 1500-1700 PM)
+    """
+    time_range, _, label = text.strip().partition(" ")
+    result = _valid_time_range(time_range)
+    if not result:
+        return None
+    start, end = result
+    return start, end, label.strip() or None
+
 def _admin_menu_keyboard():
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🕒 Set SFT timing", callback_data="ptadmin:set_timing")],
+        [InlineKeyboardButton("🕒 Open SFT window", callback_data="ptadmin:set_timing")],
+        [InlineKeyboardButton("🔒 Close SFT window", callback_data="ptadmin:close")],
         [InlineKeyboardButton("🗑️ Remove cadets from SFT", callback_data="ptadmin:remove")],
+        [InlineKeyboardButton("🤝 Match under-filled activities", callback_data="ptadmin:match")],
         [InlineKeyboardButton("📊 Generate SFT report", callback_data="ptadmin:generate")],
     ])
 
 
+async def _pick_window(update, action: str, data: str):
+    """
+    The window an admin action applies to: the one in the callback data, or
+    the only open one. Otherwise shows a window picker and returns None.
+    """
+    if "|" in data:
+        window = SFTService.get_window(int(data.split("|", 1)[1]))
+        if not window:
+            await reply(
+                update,
+                "❌ That SFT window is no longer open.",
+                reply_markup=_admin_menu_keyboard(),
+            )
+        return window
+
+    windows = SFTService.open_windows()
+    if not windows:
+        await reply(
+            update,
+            "❌ No open SFT window found. Open one first.",
+            reply_markup=_admin_menu_keyboard(),
+        )
+        return None
+    if len(windows) == 1:
+        return windows[0]
+
+    keyboard = [
+        [InlineKeyboardButton(window.title, callback_data=f"ptadmin:{action}|{window.id}")]
+        for window in windows
+    ]
+    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")])
+    await reply(update, "Select SFT window:", reply_markup=InlineKeyboardMarkup(keyboard))
+    return None
+
+
+async def _show_match_plan(update, context, window):
+    plan = propose_matches(window.id)
+    # Buttons carry an index into this list; the ids and targets stay server-side.
+    context.user_data["sft_fix_window"] = window.id
+    context.user_data["sft_fixes"] = [
+        (proposal.submission.id, proposal.target) for proposal in plan.proposals
+    ]
+
+    if not plan.proposals and not plan.unmatched:
+        await reply(
+            update,
+            f"✅ Every activity in {window.title} has at least {SFT_MIN_PARTICIPANTS} participants.",
+            reply_markup=_admin_menu_keyboard(),
+        )
+        return
+
+    lines = [f"🤝 Suggested fixes for {window.title}", ""]
+    for n, proposal in enumerate(plan.proposals, start=1):
+        lines.append(f"{n}. {proposal.description}")
+    if plan.unmatched:
+        if plan.proposals:
+            lines.append("")
+        lines.append("No overlapping compatible group for:")
+        for s in plan.unmatched:
+            lines.append(f"- {s.user_name} ({s.start}-{s.end}) {s.activity_key}")
+
+    keyboard = [
+        [InlineKeyboardButton(
+            f"✅ {n}. {proposal.submission.user_name} → {proposal.target}",
+            callback_data=f"ptadmin:fix|{n - 1}",
+        )]
+        for n, proposal in enumerate(plan.proposals, start=1)
+    ]
+    if len(plan.proposals) > 1:
+        keyboard.append([InlineKeyboardButton("✅ Apply all", callback_data="ptadmin:fix|all")])
+    if plan.unmatched:
+        keyboard.append([InlineKeyboardButton(
+            "🗑️ Remove cadets from SFT", callback_data=f"ptadmin:remove|{window.id}"
+        )])
+    keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")])
+
+    await reply(update, "\n".join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
+
+
 async def _show_admin_menu(update, context):
     context.user_data["mode"] = "PT_ADMIN"
     context.user_data["pt_admin_state"] = "menu"
+    name_picked(context)
 
     await reply(
         update,
@@ -62,7 +159,7 @@ async def _show_admin_menu(update, context):
 # ENTRY POINT
 # =========================
 async def start_pt_admin(update, context):
-    if not is_admin_user(update.effective_user.id if update.effective_user else None):
+    if not (await get_identity(update, context)).is_admin:
         await reply(update, "❌ You are not authorised.")
         return
 
@@ -79,7 +176,7 @@ async def start_pt_admin(update, context):
 # CALLBACK HANDLER
 # =========================
 async def handle_pt_admin_callbacks(update, context):
-    if not is_admin_user(update.effective_user.id if update.effective_user else None):
+    if not (await get_identity(update, context)).is_admin:
         await reply(update, "❌ You are not authorised.")
         return
 
@@ -92,29 +189,39 @@ async def handle_pt_admin_callbacks(update, context):
     if data == "ptadmin:set_timing":
         context.user_data["mode"] = "PT_ADMIN"
         context.user_data["pt_admin_state"] = "awaiting_time_range"
+        name_picked(context)
         await reply(
             update,
-            "🕒 Enter SFT time range in 24H format.\nExample: `1500-1700`\n\n"
-            "⚠️ Setting a new timing will clear all existing SFT submissions.",
+            "🕒 Enter SFT time range in 24H format, optionally followed by a label.\n"
+            "Example: `1500-1700` or `1500-1700 PM`\n\n"
+            "Other open windows and their submissions are kept.",
             parse_mode="Markdown",
         )
         return
 
-    if data == "ptadmin:remove":
-        window = SFTService.get_window()
+    if data == "ptadmin:close" or data.startswith("ptadmin:close|"):
+        window = await _pick_window(update, "close", data)
+        if not window:
+            return
+
+        await run_db(SFTService.close_window, window.id)
+        await reply(
+            update,
+            f"🔒 SFT window {window.title} closed.",
+            reply_markup=_admin_menu_keyboard(),
+        )
+        return
+
+    if data == "ptadmin:remove" or data.startswith("ptadmin:remove|"):
+        window = await _pick_window(update, "remove", data)
         if not window:
-            await reply(
-                update,
-                "❌ No active SFT timing found. Set timing first.",
-                reply_markup=_admin_menu_keyboard(),
-            )
             return
 
-        submissions = SFTService.get_submissions_for_date(window.date)
+        submissions = SFTService.get_submissions(window.id)
         if not submissions:
             await reply(
                 update,
-                "ℹ️ No SFT submissions to remove for current window.",
+                f"ℹ️ No SFT submissions to remove for {window.title}.",
                 reply_markup=_admin_menu_keyboard(),
             )
             return
@@ -124,37 +231,66 @@ async def handle_pt_admin_callbacks(update, context):
             keyboard.append([
                 InlineKeyboardButton(
                     f"🗑️ {s.user_name} ({s.start}-{s.end})",
-                    callback_data=f"ptadmin:remove_user|{s.user_id}",
+                    callback_data=f"ptadmin:remove_user|{window.id}|{s.user_id}",
                 )
             ])
         keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")])
 
         await reply(
             update,
-            "Select submission(s) to remove:",
+            f"Select submission(s) to remove from {window.title}:",
             reply_markup=InlineKeyboardMarkup(keyboard),
         )
         return
 
     if data.startswith("ptadmin:remove_user|"):
-        user_id = int(data.split("|", 1)[1])
-        removed = SFTService.remove_submission(user_id)
+        _, window_id, user_id = data.split("|", 2)
+        removed = await run_db(SFTService.remove_submission, int(user_id), int(window_id))
         message = "✅ Submission removed." if removed else "ℹ️ Submission already removed."
         await reply(update, message, reply_markup=_admin_menu_keyboard())
         return
 
-    if data == "ptadmin:generate":
-        window = SFTService.get_window()
+    if data == "ptadmin:match" or data.startswith("ptadmin:match|"):
+        window = await _pick_window(update, "match", data)
+        if not window:
+            return
+        await _show_match_plan(update, context, window)
+        return
+
+    if data.startswith("ptadmin:fix|"):
+        window = SFTService.get_window(context.user_data.get("sft_fix_window"))
+        fixes = context.user_data.get("sft_fixes") or []
         if not window:
             await reply(
                 update,
-                "❌ No active SFT timing found. Set timing first.",
+                "❌ That SFT window is no longer open.",
                 reply_markup=_admin_menu_keyboard(),
             )
             return
 
-        instructor_names = get_all_instructor_names()
-        if not instructor_names:
+        choice = data.split("|", 1)[1]
+        if choice == "all":
+            selected = fixes
+        elif choice.isdigit() and int(choice) < len(fixes):
+            selected = [fixes[int(choice)]]
+        else:
+            selected = []
+
+        for submission_id, target in selected:
+            await run_db(apply_proposal, submission_id, target)
+
+        # Anything else may have changed too; show the plan as it stands now.
+        await _show_match_plan(update, context, window)
+        return
+
+    if data == "ptadmin:generate" or data.startswith("ptadmin:generate|"):
+        window = await _pick_window(update, "generate", data)
+        if not window:
+            return
+        context.user_data["pending_sft_window"] = window.id
+
+        roster = await get_roster()
+        if not roster.instructors:
             await reply(
                 update,
                 "❌ No instructors found. Please import instructor data first.",
@@ -162,30 +298,38 @@ async def handle_pt_admin_callbacks(update, context):
             )
             return
 
-        keyboard = [
-            [InlineKeyboardButton(name, callback_data=f"ptadmin:pick_instructor|{name}")]
-            for name in instructor_names
-        ]
-        keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")])
-
+        remember_roster(context, roster)
         await reply(
             update,
-            "Select instructor for the SFT report greeting:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            f"Select instructor for the SFT report greeting:\n\n{SEARCH_HINT}",
+            reply_markup=await name_picker(
+                context,
+                "ptadmin:pick_instructor",
+                group="instructors",
+                footer=[("⬅️ Back", "ptadmin:menu")],
+            ),
         )
         return
 
     if data.startswith("ptadmin:pick_instructor|"):
-        window = SFTService.get_window()
+        window = SFTService.get_window(context.user_data.get("pending_sft_window"))
         if not window:
             await reply(
                 update,
-                "❌ No active SFT timing found. Set timing first.",
+                "❌ That SFT window is no longer open. Please generate report again.",
                 reply_markup=_admin_menu_keyboard(),
             )
             return
 
-        instructor_name = data.split("|", 1)[1]
+        instructor_name = await resolve_picked_name(context, data.split("|", 1)[1])
+        if not instructor_name:
+            await reply(
+                update,
+                "❌ That instructor list is out of date. Please generate report again.",
+                reply_markup=_admin_menu_keyboard(),
+            )
+            return
+        name_picked(context)
         context.user_data["pending_sft_instructor"] = instructor_name
 
         salutation_keyboard = InlineKeyboardMarkup([
@@ -204,11 +348,11 @@ async def handle_pt_admin_callbacks(update, context):
         return
 
     if data.startswith("ptadmin:pick_salutation|"):
-        window = SFTService.get_window()
+        window = SFTService.get_window(context.user_data.get("pending_sft_window"))
         if not window:
             await reply(
                 update,
-                "❌ No active SFT timing found. Set timing first.",
+                "❌ That SFT window is no longer open. Please generate report again.",
                 reply_markup=_admin_menu_keyboard(),
             )
             return
@@ -223,14 +367,20 @@ async def handle_pt_admin_callbacks(update, context):
             return
 
         salutation = data.split("|", 1)[1]
-        summary = SFTService.generate_summary(window.date, instructor_name, salutation)
+        summary = SFTService.generate_summary(window.id, instructor_name, salutation)
         context.user_data["pending_sft_summary"] = summary
 
 
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("✅ Confirm & Send", callback_data="ptadmin:send_report")],
-            [InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")],
-        ])
+        if SFTService.underfilled(window.id):
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🤝 Suggest fixes", callback_data=f"ptadmin:match|{window.id}")],
+                [InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")],
+            ])
+        else:
+            keyboard = InlineKeyboardMarkup([
+                [InlineKeyboardButton("✅ Confirm & Send", callback_data="ptadmin:send_report")],
+                [InlineKeyboardButton("⬅️ Back", callback_data="ptadmin:menu")],
+            ])
 
         await reply(
             update,
@@ -255,6 +405,7 @@ async def handle_pt_admin_callbacks(update, context):
         await reply(update, "✅ SFT report sent to IC chat.", reply_markup=_admin_menu_keyboard())
         context.user_data.pop("pending_sft_summary", None)
         context.user_data.pop("pending_sft_instructor", None)
+        context.user_data.pop("pending_sft_window", None)
         return
 
     if data == "ptadmin:menu":
@@ -271,23 +422,21 @@ async def handle_pt_admin_text(update, context):
     if context.user_data.get("pt_admin_state") != "awaiting_time_range":
         return
 
-    result = _valid_time_range(update.message.text.strip())
+    result = _parse_window_input(update.message.text)
     if not result:
-        await reply(update, "❌ Invalid format. Use HHMM-HHMM (24H).")
+        await reply(update, "❌ Invalid format. Use HHMM-HHMM (24H), optionally followed by a label.")
         return
 
-    start, end = result
+    start, end, label = result
     date = today_sg()
 
-    # Requirement: any new SFT timing clears all previous submissions.
-    SFTService.clear_submissions()
-    set_sft_window(date, start, end)
+    window = await run_db(open_sft_window, date, start, end, label)
+    slot_table(window)
 
     await reply(
         update,
-        f"✅ *PT SFT window set*\n\n"
-        f"Date: {date}\n"
-        f"Time: {start}-{end}\n\n"
+        f"✅ *PT SFT window opened*\n\n"
+        f"Window: {escape_markdown(window.title)}\n\n"
         f"Cadets may now submit SFT.",
         reply_markup=_admin_menu_keyboard(),
         parse_mode="Markdown",
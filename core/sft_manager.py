@@ -1,35 +1,128 @@
+from dataclasses import dataclass
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
 
 from bot.helpers import reply
+from config.constants import ACTIVITIES, SFT_MIN_PARTICIPANTS, SFT_SLOT_MINUTES
 from services.db_service import SFTService
-from db.crud import get_user_by_telegram_id
+from db.async_crud import run_db
+from bot.identity import get_identity
+from utils.time_utils import hhmm_to_minutes
 
 
 # =========================
 # TIME HELPERS
 # =========================
 
-def _time_to_minutes(t: str) -> int:
-    return int(t[:2]) * 60 + int(t[2:])
-
-
 def _minutes_to_time(m: int) -> str:
     return f"{m // 60:02d}{m % 60:02d}"
 
 
 def _generate_time_slots(start: str, end: str):
     """
-    Generate 15-min interval times between start and end (inclusive).
+    Generate SFT_SLOT_MINUTES interval times between start and end (inclusive).
     """
-    start_m = _time_to_minutes(start)
-    end_m = _time_to_minutes(end)
+    start_m = hhmm_to_minutes(start)
+    end_m = hhmm_to_minutes(end)
 
     return [
         _minutes_to_time(m)
-        for m in range(start_m, end_m + 1, 15)
+        for m in range(start_m, end_m + 1, SFT_SLOT_MINUTES)
     ]
 
 
+# =========================
+# SLOT TABLES
+# =========================
+
+@dataclass(frozen=True)
+class SlotTable:
+    """
+    START/END keyboards built from a window's time slots.
+    Windows never change once opened, so one table serves every cadet.
+    """
+    start_keyboard: InlineKeyboardMarkup
+    end_keyboards: dict[str, InlineKeyboardMarkup]  # start time -> END keyboard
+
+    @classmethod
+    def build(cls, start: str, end: str) -> "SlotTable":
+        times = tuple(_generate_time_slots(start, end))
+        start_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(t, callback_data=f"sft_start|{t}")]
+            for t in times
+        ])
+        # Slots are ascending, so the valid END times are simply the later ones.
+        end_keyboards = {
+            t: InlineKeyboardMarkup([
+                [InlineKeyboardButton(e, callback_data=f"sft_end|{e}")]
+                for e in times[i + 1:]
+            ])
+            for i, t in enumerate(times)
+        }
+        return cls(
+            start_keyboard=start_keyboard,
+            end_keyboards=end_keyboards,
+        )
+
+
+# window id -> slot table
+_slot_tables: dict[int, SlotTable] = {}
+
+
+def slot_table(window) -> SlotTable:
+    table = _slot_tables.get(window.id)
+    if table is None:
+        # Drop tables of windows that have since closed.
+        open_ids = {w.id for w in SFTService.open_windows()}
+        for window_id in [k for k in _slot_tables if k not in open_ids]:
+            del _slot_tables[window_id]
+        table = _slot_tables[window.id] = SlotTable.build(window.start, window.end)
+    return table
+
+
+async def close_expired_windows_job(context):
+    for window in await run_db(SFTService.close_expired):
+        _slot_tables.pop(window.id, None)
+
+
+# =========================
+# WINDOW / ACTIVITY MENUS
+# =========================
+
+def sft_window_keyboard(windows) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(window.title, callback_data=f"sft_window|{window.id}")]
+        for window in windows
+    ])
+
+
+async def show_sft_activities(update, context, window):
+    context.user_data["sft_window_id"] = window.id
+    context.user_data["date"] = window.date
+
+    headcounts = SFTService.headcounts(window.id)
+    keyboard = [
+        [
+            InlineKeyboardButton(
+                f"{activity} ({headcounts.get(activity, 0)})",
+                callback_data=f"sft_activity|{activity}"
+            )
+        ]
+        for activity in ACTIVITIES
+    ]
+
+    await reply(
+        update,
+        f"🏋️ *PT SFT Open*\n\n"
+        f"Window: {escape_markdown(window.title)}\n\n"
+        f"Select activity (current headcount in brackets; "
+        f"each activity needs at least {SFT_MIN_PARTICIPANTS}):",
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        parse_mode="Markdown",
+    )
+
+
 # =========================
 # SFT CALLBACK HANDLER
 # =========================
@@ -39,14 +132,26 @@ async def handle_sft_callbacks(update, context):
     data = query.data
 
     # ------------------------------
-    # SAFETY: window must exist
+    # WINDOW SELECTED
+    # ------------------------------
+    if data.startswith("sft_window|"):
+        window = SFTService.get_window(int(data.split("|", 1)[1]))
+        if not window:
+            await reply(update, "❌ That SFT window has closed. Use /start_sft to see open windows.")
+            context.user_data.clear()
+            return
+        await show_sft_activities(update, context, window)
+        return
+
+    # ------------------------------
+    # SAFETY: window must still be open
     # ------------------------------
-    window = SFTService.get_window()
+    window = SFTService.get_window(context.user_data.get("sft_window_id"))
     if not window:
         await reply(
             update,
-            "❌ PT SFT has not been opened by IC yet.\n"
-            "Please wait for instructions."
+            "❌ This SFT window is no longer open.\n"
+            "Use /start_sft to see open windows."
         )
         context.user_data.clear()
         return
@@ -54,8 +159,7 @@ async def handle_sft_callbacks(update, context):
     # ------------------------------
     # Resolve user via Telegram ID
     # ------------------------------
-    telegram_id = update.effective_user.id
-    user = get_user_by_telegram_id(telegram_id)
+    user = (await get_identity(update, context)).user
 
     if not user:
         await reply(
@@ -69,9 +173,7 @@ async def handle_sft_callbacks(update, context):
     context.user_data["user_id"] = user.id
     context.user_data["user_name"] = user.full_name
 
-    # Precompute allowed times
-    allowed_times = _generate_time_slots(window.start, window.end)
-    context.user_data["allowed_times"] = allowed_times
+    slots = slot_table(window)
 
     # ------------------------------
     # ACTIVITY SELECTED
@@ -92,15 +194,10 @@ async def handle_sft_callbacks(update, context):
         context.user_data["activity"] = activity
         context.user_data["location"] = location
 
-        keyboard = [
-            [InlineKeyboardButton(t, callback_data=f"sft_start|{t}")]
-            for t in allowed_times
-        ]
-
         await reply(
             update,
             "Select *START* time:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=slots.start_keyboard,
             parse_mode="Markdown",
         )
 
@@ -109,22 +206,21 @@ async def handle_sft_callbacks(update, context):
     # ------------------------------
     elif data.startswith("sft_start|"):
         start = data.split("|")[1]
-        context.user_data["start"] = start
-
-        end_times = [
-            t for t in allowed_times
-            if _time_to_minutes(t) > _time_to_minutes(start)
-        ]
+        end_keyboard = slots.end_keyboards.get(start)
+        if end_keyboard is None:
+            await reply(
+                update,
+                "❌ That time is outside the SFT window. Please select again.",
+                reply_markup=slots.start_keyboard,
+            )
+            return
 
-        keyboard = [
-            [InlineKeyboardButton(t, callback_data=f"sft_end|{t}")]
-            for t in end_times
-        ]
+        context.user_data["start"] = start
 
         await reply(
             update,
             "Select *END* time:",
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=end_keyboard,
             parse_mode="Markdown",
         )
 
@@ -162,7 +258,9 @@ async def handle_sft_callbacks(update, context):
     # ------------------------------
     elif data == "sft_confirm":
         try:
-            SFTService.add_submission(
+            await run_db(
+                SFTService.add_submission,
+                window_id=window.id,
                 user_id=context.user_data["user_id"],
                 user_name=context.user_data["user_name"],
                 activity=context.user_data["activity"],
@@ -0,0 +1,72 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from db import crud
+from db.parade import parade_aggregate
+from db.roster import roster_cache
+
+# Each crud call opens its own unit-of-work session, so a small pool is safe.
+# The event loop only awaits the result.
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db")
+
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking DB callable on the DB executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def _async(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, **kwargs)
+    return wrapper
+
+
+# ---------- Users ----------
+
+clear_user_data = _async(crud.clear_user_data)
+list_users = _async(crud.list_users)
+
+
+async def get_roster():
+    # Served from memory; only the first read after a users change hits the DB.
+    roster = roster_cache.peek()
+    if roster is not None:
+        return roster
+    return await run_db(roster_cache.get)
+
+
+# ---------- Medical Events ----------
+
+get_user_records = _async(crud.get_user_records)
+get_ma_records = _async(crud.get_ma_records)
+create_ma_record = _async(crud.create_ma_record)
+update_ma_record = _async(crud.update_ma_record)
+get_user_rsi_records = _async(crud.get_user_rsi_records)
+
+# ---------- Parade State ----------
+
+async def get_parade_snapshot(today):
+    # Served from memory; only a stale aggregate needs the executor to rebuild.
+    snapshot = parade_aggregate.peek_snapshot(today)
+    if snapshot is None:
+        snapshot = await run_db(parade_aggregate.snapshot, today)
+    return snapshot
+
+
+async def get_user_parade_statuses(user_ids, today):
+    statuses = parade_aggregate.peek_user_statuses(user_ids, today)
+    if statuses is None:
+        statuses = await run_db(parade_aggregate.user_statuses, user_ids, today)
+    return statuses
+
+
+async def get_users_with_parade_status(today):
+    users = parade_aggregate.peek_users_with_status(today)
+    if users is None:
+        users = await run_db(parade_aggregate.users_with_status, today)
+    return users
@@ -0,0 +1,64 @@
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy.orm import sessionmaker
+
+from db import crud
+from db.database import ENGINE_PROFILES, build_engine
+from db.models import Base, User
+
+
+def bench_profile(profile: str, commits: int) -> dict:
+    """Time one commit per create_medical_status call, like a burst of RSO submissions."""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite:///{Path(tmp) / 'bench.db'}", profile)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+        with Session() as session:
+            user = User(full_name="BENCH CADET", rank="ME4T", role="Cadet", telegram_id=1)
+            session.add(user)
+            session.commit()
+            user_id = user.id
+
+        latencies = []
+        for _ in range(commits):
+            started = time.perf_counter()
+            with Session() as session:
+                crud.create_medical_status(
+                    user_id=user_id,
+                    status_type="MC",
+                    description="1 DAY MC",
+                    start_date=date.today(),
+                    end_date=date.today(),
+                    session=session,
+                )
+                session.commit()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        engine.dispose()
+
+    latencies.sort()
+    return {
+        "total_ms": sum(latencies),
+        "median_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def run(commits: int = 500):
+    print(f"{commits} single-row commits per profile")
+    for profile in ENGINE_PROFILES:
+        result = bench_profile(profile, commits)
+        print(
+            f"{profile:<12} total {result['total_ms']:8.1f} ms  "
+            f"median {result['median_ms']:6.3f} ms  p95 {result['p95_ms']:6.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -1,63 +1,45 @@
 from datetime import date, datetime, time
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from db.database import SessionLocal
-from db.models import MedicalEvent, MedicalStatus, User
+from sqlalchemy import func, or_
+from db.database import on_commit, unit_of_work
+from db.models import MedicalEvent, MedicalStatus, SftSessions, SftSubmissions, User
+from db.parade import PARADE_EVENT_TYPES, ParadeEvent, ParadeStatus, parade_aggregate
+from db.roster import roster_cache
 from utils.datetime_utils import now_sg, SG_TZ
 
-db = SessionLocal()
-
-# ---------- Users ----------
-
-db = SessionLocal()
-
-def get_user_by_telegram_id(telegram_id: int):
-    session = SessionLocal()
-    try:
-        return session.query(User).filter(User.telegram_id == telegram_id).first()
-    finally:
-        session.close()
-
-def get_admin_telegram_ids() -> list[int]:
-    session = SessionLocal()
-    try:
-        rows = session.query(User.telegram_id).filter(
-            User.is_admin.is_(True),
-            User.is_active.is_(True),
-            User.telegram_id.isnot(None),
-        ).all()
-        return [row[0] for row in rows]
-    finally:
-        session.close()
+# Every function below runs in its own unit of work unless the caller passes
+# session=... to batch several operations into a single commit.
 
+# ---------- Parade state hooks ----------
+# Medical writes push their committed rows into the parade state aggregate.
 
-def get_admin_telegram_ids() -> list[int]:
-    session = SessionLocal()
-    try:
-        rows = session.query(User.telegram_id).filter(
-            User.is_admin.is_(True),
-            User.is_active.is_(True),
-            User.telegram_id.isnot(None),
-        ).all()
-        return [row[0] for row in rows]
-    finally:
-        session.close()
+def _track_event(session: Session, event: MedicalEvent, user: User | None = None):
+    entry = ParadeEvent.from_rows(event, user or session.get(User, event.user_id))
+    on_commit(session, lambda: parade_aggregate.record_event(entry))
 
-def is_admin_user(user_id: int | None) -> bool:
-    if user_id is None:
-        return False
+def _track_status(session: Session, status: MedicalStatus, event: MedicalEvent | None = None):
+    # Parade state only lists statuses that come from a medical event.
+    if status.source_event_id is None:
+        return
+    event = event or session.get(MedicalEvent, status.source_event_id)
+    user = session.get(User, status.user_id)
+    entry = ParadeStatus.from_rows(status, user, event)
+    on_commit(session, lambda: parade_aggregate.record_status(entry))
 
-    if user_id in ADMIN_IDS:
-        return True
-
-    user = get_user_by_telegram_id(user_id)
-    return bool(user and user.is_admin and user.is_active)
-
-
-def get_all_admin_user_ids() -> list[int]:
-    return sorted(set(ADMIN_IDS) | set(get_admin_telegram_ids()))
+def _track_users_changed(session: Session):
+    on_commit(session, parade_aggregate.invalidate)
+    on_commit(session, roster_cache.invalidate)
 
+# ---------- Users ----------
 
+@unit_of_work
+def get_admin_telegram_ids(session: Session) -> list[int]:
+    rows = session.query(User.telegram_id).filter(
+        User.is_admin.is_(True),
+        User.is_active.is_(True),
+        User.telegram_id.isnot(None),
+    ).all()
+    return [row[0] for row in rows]
 
 def _normalize_username(value: str | None):
     if value is None:
@@ -69,7 +51,9 @@ def _normalize_username(value: str | None):
         name = name[1:]
     return name or None
 
+@unit_of_work
 def create_user(
+    session: Session,
     full_name: str,
     rank: str,
     role: str,
@@ -83,11 +67,11 @@ def create_user(
         raise ValueError("telegram_id or telegram_username is required")
 
     if telegram_id is not None:
-        existing = db.query(User).filter(User.telegram_id == telegram_id).first()
+        existing = session.query(User).filter(User.telegram_id == telegram_id).first()
         if existing:
             raise ValueError("telegram_id already exists")
     if telegram_username:
-        existing = db.query(User).filter(User.telegram_username == telegram_username).first()
+        existing = session.query(User).filter(User.telegram_username == telegram_username).first()
         if existing:
             raise ValueError("telegram_username already exists")
 
@@ -100,65 +84,44 @@ def create_user(
         is_admin=is_admin,
         is_active=is_active,
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    session.add(user)
+    session.flush()
+    _track_users_changed(session)
     return user
 
-def clear_user_data() -> dict[str, int]:
-    session = SessionLocal()
-    try:
-        statuses_deleted = session.query(MedicalStatus).delete(synchronize_session=False)
-        events_deleted = session.query(MedicalEvent).delete(synchronize_session=False)
-        users_deleted = session.query(User).delete(synchronize_session=False)
-        session.commit()
-        return {
-            "medical_statuses": statuses_deleted,
-            "medical_events": events_deleted,
-            "users": users_deleted,
-        }
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
-
-def list_users(limit: int = 200) -> list[User]:
-    session = SessionLocal()
-    try:
-        return (
-            session.query(User)
-            .order_by(User.rank, User.full_name)
-            .limit(limit)
-            .all()
-        )
-    finally:
-        session.close()
-
-def get_all_cadet_names():
-    session = SessionLocal()
-    try:
-        records = session.query(User).filter(
-            func.lower(User.role) == "cadet",
-            User.is_active.is_(True),
-        ).all()
-        return [record.rank + " " + record.full_name for record in records]
-    finally:
-        session.close()
-
-def get_all_instructor_names():
-    session = SessionLocal()
-    try:
-        records = session.query(User).filter(
-            func.lower(User.role) == "instructor"
-        ).all()
-        return [record.rank + " " + record.full_name for record in records]
-    finally:
-        session.close()
+@unit_of_work
+def clear_user_data(session: Session) -> dict[str, int]:
+    statuses_deleted = session.query(MedicalStatus).delete(synchronize_session=False)
+    events_deleted = session.query(MedicalEvent).delete(synchronize_session=False)
+    # Reimported users reuse ids, so they must not inherit old SFT submissions.
+    submissions_deleted = session.query(SftSubmissions).delete(synchronize_session=False)
+    users_deleted = session.query(User).delete(synchronize_session=False)
+    _track_users_changed(session)
+    return {
+        "medical_statuses": statuses_deleted,
+        "medical_events": events_deleted,
+        "sft_submissions": submissions_deleted,
+        "users": users_deleted,
+    }
+
+@unit_of_work
+def list_users(session: Session, limit: int = 200) -> list[User]:
+    return (
+        session.query(User)
+        .order_by(User.rank, User.full_name)
+        .limit(limit)
+        .all()
+    )
+
+@unit_of_work
+def get_roster_users(session: Session) -> list[User]:
+    return session.query(User).order_by(User.id).all()
 
 # ---------- Medical ----------
 
+@unit_of_work
 def create_medical_event(
+    session: Session,
     user_id: int,
     event_type: str,
     symptoms: str,
@@ -174,12 +137,14 @@ def create_medical_event(
         diagnosis=diagnosis,
         event_datetime=event_datetime,
     )
-    db.add(event)
-    db.commit()
-    db.refresh(event)
+    session.add(event)
+    session.flush()
+    _track_event(session, event)
     return event
 
+@unit_of_work
 def create_medical_status(
+    session: Session,
     user_id: int,
     status_type: str,
     description: str,
@@ -195,13 +160,14 @@ def create_medical_status(
         end_date=end_date,
         source_event_id=source_event_id,
     )
-    db.add(status)
-    db.commit()
-    db.refresh(status)
+    session.add(status)
+    session.flush()
+    _track_status(session, status)
     return status
 
-def get_active_statuses(today):
-    return db.query(
+@unit_of_work
+def get_active_statuses(session: Session, today):
+    return session.query(
         MedicalStatus,
         User,
         MedicalEvent,
@@ -212,48 +178,57 @@ def get_active_statuses(today):
 		).filter(
         MedicalStatus.start_date <= today,
         MedicalStatus.end_date >= today
-    ).all()
+    ).order_by(MedicalStatus.id).all()
 
-def delete_expired_statuses_and_events(target_date: date) -> tuple[int, int]:
+@unit_of_work
+def delete_expired_statuses_and_events(session: Session, target_date: date) -> tuple[int, int]:
     """Delete medical statuses/events before target_date. Returns (statuses, events)."""
-    session = SessionLocal()
-    try:
-        target_start = datetime.combine(target_date, time.min, tzinfo=SG_TZ)
-        statuses_deleted = session.query(MedicalStatus).filter(
-            MedicalStatus.end_date < target_date
-        ).delete(synchronize_session=False)
-        events_deleted = session.query(MedicalEvent).filter(
-            MedicalEvent.event_datetime < target_start
-        ).delete(synchronize_session=False)
-        session.commit()
-        return statuses_deleted, events_deleted
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+    target_start = datetime.combine(target_date, time.min, tzinfo=SG_TZ)
+    statuses_deleted = session.query(MedicalStatus).filter(
+        MedicalStatus.end_date < target_date
+    ).delete(synchronize_session=False)
+    events_deleted = session.query(MedicalEvent).filter(
+        MedicalEvent.event_datetime < target_start
+    ).delete(synchronize_session=False)
+    on_commit(session, lambda: parade_aggregate.prune(target_date))
+    return statuses_deleted, events_deleted
 
 # ---------- Medical Events ----------
 
-# RSO Records
+def _find_user_by_name(session: Session, name: str):
+    parts = name.split(maxsplit=1)
+    if len(parts) != 2:
+        raise ValueError("Invalid name format")
+    rank, full_name = parts
+    user = session.query(User).filter(User.rank == rank, User.full_name == full_name).first()
+    if not user:
+        raise ValueError("User not found")
+    return user
 
-def get_user_records(name: str):
+def _get_named_events(session: Session, name: str, event_type: str):
     parts = name.split(maxsplit=1)
     if len(parts) != 2:
         return []
     rank, full_name = parts
-    return db.query(MedicalEvent).join(User).filter(
+    return session.query(MedicalEvent).join(User).filter(
         User.rank == rank,
         User.full_name == full_name,
-        MedicalEvent.event_type == "RSO"
+        MedicalEvent.event_type == event_type
     ).all()
 
+# RSO Records
+
+@unit_of_work
+def get_user_records(session: Session, name: str):
+    return _get_named_events(session, name, "RSO")
+
 
 def _has_diagnosis(value: str | None) -> bool:
     return bool(value and value.strip())
 
-def update_user_record(record_id: int, symptoms: str, diagnosis: str,status: str, start_date: str, end_date: str):
-    record = db.query(MedicalEvent).filter(MedicalEvent.id == record_id).first()
+@unit_of_work
+def update_user_record(session: Session, record_id: int, symptoms: str, diagnosis: str,status: str, start_date: str, end_date: str):
+    record = session.query(MedicalEvent).filter(MedicalEvent.id == record_id).first()
     if record:
         if _has_diagnosis(record.diagnosis):
             return record
@@ -268,23 +243,20 @@ def update_user_record(record_id: int, symptoms: str, diagnosis: str,status: str
             end_date=datetime.strptime(end_date, "%d%m%y").date(),
             source_event_id=record.id
         )
-        db.add(medical_status)
-        db.commit()
-        db.refresh(record)
+        session.add(medical_status)
+        session.flush()
+        _track_event(session, record)
+        _track_status(session, medical_status, record)
     return record
 
+@unit_of_work
 def create_user_record(
+    session: Session,
     name: str,
     symptoms: str,
     diagnosis: str | None = None
 ):
-    parts = name.split(maxsplit=1)
-    if len(parts) != 2:
-        raise ValueError("Invalid name format")
-    rank, full_name = parts
-    user = db.query(User).filter(User.rank == rank, User.full_name == full_name).first()
-    if not user:
-        raise ValueError("User not found")
+    user = _find_user_by_name(session, name)
 
     event = MedicalEvent(
         user_id=user.id,
@@ -293,38 +265,27 @@ def create_user_record(
         diagnosis=diagnosis,
         event_datetime=now_sg().replace(microsecond=0),
     )
-    db.add(event)
-    db.commit()
-    db.refresh(event)
+    session.add(event)
+    session.flush()
+    _track_event(session, event, user)
     return event
 
 # MA Records
 
-def get_ma_records(name: str):
-    parts = name.split(maxsplit=1)
-    if len(parts) != 2:
-        return []
-    rank, full_name = parts
-    return db.query(MedicalEvent).join(User).filter(
-        User.rank == rank,
-        User.full_name == full_name,
-        MedicalEvent.event_type == "MA"
-    ).all()
+@unit_of_work
+def get_ma_records(session: Session, name: str):
+    return _get_named_events(session, name, "MA")
 
+@unit_of_work
 def create_ma_record(
+    session: Session,
     name: str,
     appointment: str,
     appointment_location: str,
     appointment_date: str,
     appointment_time: str
 ):
-    parts = name.split(maxsplit=1)
-    if len(parts) != 2:
-        raise ValueError("Invalid name format")
-    rank, full_name = parts
-    user = db.query(User).filter(User.rank == rank, User.full_name == full_name).first()
-    if not user:
-        raise ValueError("User not found")
+    user = _find_user_by_name(session, name)
 
     appointment_dt = datetime.combine(
         datetime.strptime(appointment_date, "%d%m%y").date(),
@@ -338,12 +299,14 @@ def create_ma_record(
         location=appointment_location,
         event_datetime=appointment_dt,
     )
-    db.add(event)
-    db.commit()
-    db.refresh(event)
+    session.add(event)
+    session.flush()
+    _track_event(session, event, user)
     return event
 
+@unit_of_work
 def update_ma_record(
+    session: Session,
     record_id: int,
     appointment: str,
     appointment_location: str,
@@ -351,7 +314,7 @@ def update_ma_record(
     appointment_time: str,
     instructor: str | None = None
 ):
-    record = db.query(MedicalEvent).filter(MedicalEvent.id == record_id).first()
+    record = session.query(MedicalEvent).filter(MedicalEvent.id == record_id).first()
     if record:
         record.appointment_type = appointment
         record.location = appointment_location
@@ -362,34 +325,23 @@ def update_ma_record(
         )
         if instructor:
             record.endorsed_by = instructor
-        db.commit()
-        db.refresh(record)
+        session.flush()
+        _track_event(session, record)
     return record
 
 # RSI Records
-def get_user_rsi_records(name: str):
-    parts = name.split(maxsplit=1)
-    if len(parts) != 2:
-        return []
-    rank, full_name = parts
-    return db.query(MedicalEvent).join(User).filter(
-        User.rank == rank,
-        User.full_name == full_name,
-        MedicalEvent.event_type == "RSI"
-    ).all()
+@unit_of_work
+def get_user_rsi_records(session: Session, name: str):
+    return _get_named_events(session, name, "RSI")
 
+@unit_of_work
 def create_rsi_record(
+    session: Session,
     name: str,
     symptoms: str,
     diagnosis: str | None = None
 ):
-    parts = name.split(maxsplit=1)
-    if len(parts) != 2:
-        raise ValueError("Invalid name format")
-    rank, full_name = parts
-    user = db.query(User).filter(User.rank == rank, User.full_name == full_name).first()
-    if not user:
-        raise ValueError("User not found")
+    user = _find_user_by_name(session, name)
 
     event = MedicalEvent(
         user_id=user.id,
@@ -398,12 +350,14 @@ def create_rsi_record(
         diagnosis=diagnosis or "",
         event_datetime=now_sg().replace(microsecond=0),
     )
-    db.add(event)
-    db.commit()
-    db.refresh(event)
+    session.add(event)
+    session.flush()
+    _track_event(session, event, user)
     return event
 
+@unit_of_work
 def update_rsi_record(
+    session: Session,
     record_id: int,
     diagnosis: str,
     status_type: str,
@@ -411,15 +365,13 @@ def update_rsi_record(
     start_date: str,
     end_date: str
 ):
-    record = db.query(MedicalEvent).filter(MedicalEvent.id == record_id).first()
+    record = session.query(MedicalEvent).filter(MedicalEvent.id == record_id).first()
     if record:
         if _has_diagnosis(record.diagnosis):
             return record
         record.diagnosis = diagnosis
-        if status == "N/A":
-            db.commit()
-            db.refresh(record)
-        else:
+        medical_status = None
+        if status != "N/A":
             medical_status = MedicalStatus(
                 user_id=record.user_id,
                 status_type=status_type,
@@ -428,27 +380,147 @@ def update_rsi_record(
                 end_date=datetime.strptime(end_date, "%d%m%y").date(),
                 source_event_id=record.id
             )
-            db.add(medical_status)
-            db.commit()
-            db.refresh(record)
+            session.add(medical_status)
+        session.flush()
+        _track_event(session, record)
+        if medical_status is not None:
+            _track_status(session, medical_status, record)
         return record
 
 
-# Other Queries
-def get_medical_events():
-    return db.query(
-        MedicalEvent,
-        User
-	).join(
-		User, MedicalEvent.user_id == User.id
-    ).all()
+# Parade State
 
-def get_all_cadets():
-    return db.query(User).filter(
-        User.role == "cadet"
-	).all()
+@unit_of_work
+def count_active_cadets(session: Session) -> int:
+    return session.query(func.count(User.id)).filter(
+        func.lower(User.role) == "cadet",
+        User.is_active.is_(True),
+    ).scalar()
 
-def get_all_instructors():
-    return db.query(User).filter(
-        User.role == "instructor"
-    ).all()
+@unit_of_work
+def get_undiagnosed_events(session: Session, event_types=PARADE_EVENT_TYPES):
+    return session.query(
+        MedicalEvent,
+        User
+    ).join(
+        User, MedicalEvent.user_id == User.id
+    ).filter(
+        MedicalEvent.event_type.in_(event_types),
+        or_(MedicalEvent.diagnosis.is_(None), MedicalEvent.diagnosis == ""),
+    ).order_by(MedicalEvent.id).all()
+
+@unit_of_work
+def get_unexpired_statuses(session: Session, today: date):
+    """Statuses that are active today or start later; the parade state aggregate keeps these."""
+    return session.query(
+        MedicalStatus,
+        User,
+        MedicalEvent,
+    ).join(
+        User, MedicalStatus.user_id == User.id
+    ).join(
+        MedicalEvent, MedicalStatus.source_event_id == MedicalEvent.id
+    ).filter(
+        MedicalStatus.end_date >= today
+    ).order_by(MedicalStatus.id).all()
+
+@unit_of_work
+def get_parade_state_rows(session: Session, today: date) -> dict:
+    """Only the rows parade state renders, filtered and counted in SQL in one session."""
+    return {
+        "events": get_undiagnosed_events(session=session),
+        "statuses": get_active_statuses(today, session=session),
+        "total_strength": count_active_cadets(session=session),
+    }
+
+# ---------- SFT ----------
+
+@unit_of_work
+def create_sft_session(
+    session: Session,
+    start_datetime: datetime,
+    end_datetime: datetime,
+    label: str | None = None,
+) -> SftSessions:
+    sft_session = SftSessions(
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        label=label,
+    )
+    session.add(sft_session)
+    session.flush()
+    return sft_session
+
+@unit_of_work
+def get_open_sft_sessions(session: Session) -> list[SftSessions]:
+    return session.query(SftSessions).filter(
+        SftSessions.closed_at.is_(None)
+    ).order_by(SftSessions.id).all()
+
+@unit_of_work
+def close_sft_session(session: Session, session_id: int) -> bool:
+    updated = session.query(SftSessions).filter(
+        SftSessions.id == session_id,
+        SftSessions.closed_at.is_(None),
+    ).update({SftSessions.closed_at: now_sg()}, synchronize_session=False)
+    return updated > 0
+
+@unit_of_work
+def create_sft_submission(
+    session: Session,
+    session_id: int,
+    user_id: int,
+    user_name: str,
+    activity: str,
+    location: str,
+    start: str,
+    end: str,
+) -> SftSubmissions:
+    submission = SftSubmissions(
+        session_id=session_id,
+        user_id=user_id,
+        user_name=user_name,
+        activity=activity,
+        location=location,
+        start=start,
+        end=end,
+    )
+    session.add(submission)
+    session.flush()
+    return submission
+
+@unit_of_work
+def get_open_sft_submissions(session: Session) -> list[SftSubmissions]:
+    return session.query(SftSubmissions).join(
+        SftSessions, SftSubmissions.session_id == SftSessions.id
+    ).filter(
+        SftSessions.closed_at.is_(None)
+    ).order_by(SftSubmissions.id).all()
+
+@unit_of_work
+def update_sft_submission_activity(
+    session: Session,
+    submission_id: int,
+    activity: str,
+    location: str,
+) -> bool:
+    updated = session.query(SftSubmissions).filter(
+        SftSubmissions.id == submission_id
+    ).update(
+        {SftSubmissions.activity: activity, SftSubmissions.location: location},
+        synchronize_session=False,
+    )
+    return updated > 0
+
+@unit_of_work
+def delete_sft_submissions(
+    session: Session,
+    user_id: int | None = None,
+    session_id: int | None = None,
+) -> int:
+    query = session.query(SftSubmissions)
+    if user_id is not None:
+        query = query.filter(SftSubmissions.user_id == user_id)
+    if session_id is not None:
+        query = query.filter(SftSubmissions.session_id == session_id)
+    return query.delete(synchronize_session=False)
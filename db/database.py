@@ -1,11 +1,106 @@
+import functools
+import logging
+import os
+from contextlib import contextmanager
 from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+logger = logging.getLogger(__name__)
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DATABASE_PATH = PROJECT_ROOT / "bot.db"
 DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# PRAGMAs applied to every new SQLite connection, selected with DB_PROFILE.
+_WAL_PRAGMAS = {
+    "journal_mode": "WAL",          # readers no longer block the writer
+    "synchronous": "NORMAL",        # fsync at checkpoints, not on every commit
+    "mmap_size": 64 * 1024 * 1024,
+    "cache_size": -16000,           # negative = KiB, so ~16 MB
+    "busy_timeout": 5000,           # ms to wait for a lock instead of failing
+    "temp_store": "MEMORY",
+}
+ENGINE_PROFILES = {
+    "default": {},  # stock SQLite: rollback journal, synchronous=FULL
+    "wal": _WAL_PRAGMAS,
+    "wal-durable": {**_WAL_PRAGMAS, "synchronous": "FULL"},
+}
+DB_PROFILE = os.getenv("DB_PROFILE", "wal").strip().lower() or "wal"
+
+
+def build_engine(url: str, profile: str = DB_PROFILE):
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(
+            f"Unknown DB_PROFILE {profile!r}; expected one of {sorted(ENGINE_PROFILES)}"
+        )
+    pragmas = ENGINE_PROFILES[profile]
+    new_engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    @event.listens_for(new_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return new_engine
+
+
+engine = build_engine(DATABASE_URL)
+
+# expire_on_commit=False keeps returned rows readable after their unit of work closes.
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+
+@contextmanager
+def session_scope():
+    """One unit of work: commit on success, roll back on error, always close."""
+    session = SessionLocal()
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def unit_of_work(func):
+    """
+    Pass a fresh session as the first argument of func.
+    Callers may pass session=... to join an outer unit of work instead;
+    the outer scope then owns the single commit.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, session=None, **kwargs):
+        if session is not None:
+            return func(session, *args, **kwargs)
+        with session_scope() as session:
+            return func(session, *args, **kwargs)
+    return wrapper
+
+
+def on_commit(session, callback):
+    """Run callback once session's transaction commits. Rolled-back work never runs it."""
+    session.info.setdefault("on_commit", []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit(session):
+    for callback in session.info.pop("on_commit", []):
+        try:
+            callback()
+        except Exception:
+            # The data is already committed; a failed cache update must not undo that.
+            logger.exception("on_commit callback failed")
+
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_on_commit(session, previous_transaction):
+    session.info.pop("on_commit", None)
@@ -1,6 +1,19 @@
 import csv
-from db.database import SessionLocal
+import io
+import logging
+import os
+import time
+from contextlib import contextmanager
+from itertools import islice
+from sqlalchemy import bindparam, select
+from config.constants import IMPORT_CSV_CHUNK_SIZE
+from db.database import on_commit, session_scope
 from db.models import User
+from db.parade import parade_aggregate
+from db.roster import roster_cache
+from utils.datetime_utils import now_sg
+
+logger = logging.getLogger(__name__)
 
 REQUIRED = {"full_name", "role", "rank"}
 
@@ -57,108 +70,299 @@ def _normalize_header(value):
     return "_".join(text.split())
 
 
-def import_users(path, require_username=False):
-    session = SessionLocal()
+def _read_header(reader, require_username):
+    normalized_fieldnames = [
+        _normalize_header(name) for name in (next(reader, None) or [])
+    ]
+    header_fields = set(normalized_fieldnames)
+    if not REQUIRED.issubset(header_fields):
+        raise ValueError(f"Missing columns: {REQUIRED - header_fields}")
+    if "telegram_id" not in header_fields and "telegram_username" not in header_fields:
+        raise ValueError("CSV must include telegram_id or telegram_username column")
+    if require_username and "telegram_username" not in header_fields:
+        raise ValueError("CSV must include telegram_username column")
+    return normalized_fieldnames
+
+
+def _parse_row(normalized_row, require_username):
+    """Validate one CSV row and return the User column values it sets."""
+    telegram_id_raw = (normalized_row.get("telegram_id") or "").strip()
+    telegram_id = None
+    if telegram_id_raw:
+        try:
+            telegram_id = int(telegram_id_raw)
+        except ValueError:
+            raise ValueError(f"telegram_id must be a valid integer: {telegram_id_raw!r}")
+
+    telegram_username = _normalize_username(
+        normalized_row.get("telegram_username")
+    )
+    if telegram_id is None and not telegram_username:
+        raise ValueError("Each row must include telegram_id or telegram_username")
+    if require_username and not telegram_username:
+        raise ValueError("Each row must include telegram_username")
+
+    full_name = (normalized_row.get("full_name") or "").strip()
+    if not _require_full_caps(full_name):
+        raise ValueError(f"full_name must be FULL CAPS with no leading/trailing spaces: {full_name!r}")
+
+    rank = (normalized_row.get("rank") or "").strip().upper()
+    if not rank:
+        raise ValueError("rank is required and cannot be empty")
+    if rank not in ALLOWED_RANKS:
+        raise ValueError(f"rank must be a valid SAF rank: {rank!r}")
+
+    role_raw = (normalized_row.get("role") or "").strip().lower()
+    if role_raw not in ROLE_MAP:
+       raise ValueError(
+            f"role must be one of {sorted(ROLE_MAP.values())}: {normalized_row.get('role')!r}"
+        )
+    role = ROLE_MAP[role_raw]
+
+    is_admin = _parse_bool(normalized_row.get("is_admin"))
+    if role == "Admin":
+        base_role_raw = (normalized_row.get("base_role") or "").strip().lower()
+        if not base_role_raw:
+            raise ValueError(
+                "role=Admin requires base_role column set to Instructor or Cadet"
+            )
+        if base_role_raw not in ROLE_MAP or ROLE_MAP[base_role_raw] not in BASE_ROLES:
+            raise ValueError(
+                f"base_role must be Instructor or Cadet when role=Admin: {normalized_row.get('base_role')!r}")
+        role = ROLE_MAP[base_role_raw]
+        is_admin = True
+    if is_admin and role not in BASE_ROLES:
+        raise ValueError("is_admin can only be true when role is Instructor or Cadet")
+
+    is_active = normalized_row.get("is_active", "true")
+    values = {
+        "full_name": full_name,
+        "rank": rank,
+        "role": role,
+        "is_admin": is_admin,
+        "is_active": str(is_active).lower() != "false",
+    }
+    # Blank identifiers never overwrite the ones already stored.
+    if telegram_id is not None:
+        values["telegram_id"] = telegram_id
+    if telegram_username:
+        values["telegram_username"] = telegram_username
+    return values
+
+
+def _parse_rows(reader, fieldnames, require_username, errors=None):
+    """
+    Yield parsed rows. With an errors list, invalid rows are recorded there as
+    (line, message) and skipped; without one the first invalid row raises.
+    """
+    for raw in reader:
+        if not raw:
+            continue
+        try:
+            yield _parse_row(dict(zip(fieldnames, raw)), require_username)
+        except ValueError as exc:
+            if errors is None:
+                raise
+            errors.append((reader.line_num, str(exc)))
+
+
+@contextmanager
+def _open_source(source):
+    """
+    Yield a text stream over source: a path, a binary stream or a text stream.
+    Streams are read from their current position and left open for the caller.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="", encoding="utf-8") as f:
+            yield f
+    elif isinstance(source, io.TextIOBase):
+        yield source
+    else:
+        text = io.TextIOWrapper(source, encoding="utf-8", newline="")
+        try:
+            yield text
+        finally:
+            # Don't let the wrapper close the caller's buffer.
+            text.detach()
+
+
+def _estimate_rows(source):
+    """Rough data row count from newlines, for progress display only; None if unknown."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return _count_rows(f)
+    if source.seekable():
+        position = source.tell()
+        try:
+            return _count_rows(source)
+        finally:
+            source.seek(position)
+    return None
+
+
+def _count_rows(f):
+    newline = "\n" if isinstance(f, io.TextIOBase) else b"\n"
+    lines = sum(block.count(newline) for block in iter(lambda: f.read(1 << 16), newline[:0]))
+    return max(lines - 1, 0)
+
+
+class _UserIndex:
+    """Existing users keyed by telegram_id and telegram_username, loaded in one query."""
+
+    def __init__(self, session):
+        self.by_telegram_id = {}
+        self.by_username = {}
+        rows = session.execute(
+            select(User.id, User.telegram_id, User.telegram_username)
+        ).all()
+        for user_id, telegram_id, telegram_username in rows:
+            # Carry the stored identifiers so every UPDATE parameter set has the same keys.
+            target = {
+                "user_id": user_id,
+                "telegram_id": telegram_id,
+                "telegram_username": telegram_username,
+            }
+            if telegram_id is not None:
+                self.by_telegram_id[telegram_id] = target
+            if telegram_username:
+                self.by_username.setdefault(telegram_username, target)
+
+    def find(self, values):
+        target = None
+        if "telegram_id" in values:
+            target = self.by_telegram_id.get(values["telegram_id"])
+        if target is None and "telegram_username" in values:
+            target = self.by_username.get(values["telegram_username"])
+        return target
+
+    def register(self, values, target):
+        if "telegram_id" in values:
+            self.by_telegram_id[values["telegram_id"]] = target
+        if "telegram_username" in values:
+            self.by_username.setdefault(values["telegram_username"], target)
+
+
+def _upsert(session, rows, index):
+    """
+    Resolve parsed rows against the preloaded index and write them with one
+    executemany INSERT and one executemany UPDATE. Returns (created, updated).
+    """
+    inserts = []
+    updates = {}
     created = 0
     updated = 0
-    processed = 0
-    try:
-        with open(path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            normalized_fieldnames = [
-                _normalize_header(name) for name in (reader.fieldnames or [])
-            ]
-            header_fields = set(normalized_fieldnames)
-            if not REQUIRED.issubset(header_fields):
-                raise ValueError(f"Missing columns: {REQUIRED - header_fields}")
-            if "telegram_id" not in header_fields and "telegram_username" not in header_fields:
-                raise ValueError("CSV must include telegram_id or telegram_username column")
-            if require_username and "telegram_username" not in header_fields:
-                raise ValueError("CSV must include telegram_username column")
-
-            for row in reader:
-                processed += 1
-                normalized_row = {
-                    _normalize_header(key): value for key, value in row.items()
-                }
-                telegram_id_raw = (normalized_row.get("telegram_id") or "").strip()
-                telegram_id = None
-                if telegram_id_raw:
-                    try:
-                        telegram_id = int(telegram_id_raw)
-                    except ValueError:
-                        raise ValueError(f"telegram_id must be a valid integer: {telegram_id_raw!r}")
-
-                telegram_username = _normalize_username(
-                    normalized_row.get("telegram_username")
-                )
-                if telegram_id is None and not telegram_username:
-                    raise ValueError("Each row must include telegram_id or telegram_username")
-                if require_username and not telegram_username:
-                    raise ValueError("Each row must include telegram_username")
-
-                full_name = (normalized_row.get("full_name") or "").strip()
-                if not _require_full_caps(full_name):
-                    raise ValueError(f"full_name must be FULL CAPS with no leading/trailing spaces: {full_name!r}")
-
-                rank = (normalized_row.get("rank") or "").strip().upper()
-                if not rank:
-                    raise ValueError("rank is required and cannot be empty")
-                if rank not in ALLOWED_RANKS:
-                    raise ValueError(f"rank must be a valid SAF rank: {rank!r}")
-
-                role_raw = (normalized_row.get("role") or "").strip().lower()
-                if role_raw not in ROLE_MAP:
-                   raise ValueError(
-                        f"role must be one of {sorted(ROLE_MAP.values())}: {normalized_row.get('role')!r}"
-                    )
-                role = ROLE_MAP[role_raw]
-
-                is_admin = _parse_bool(normalized_row.get("is_admin"))
-                if role == "Admin":
-                    base_role_raw = (normalized_row.get("base_role") or "").strip().lower()
-                    if not base_role_raw:
-                        raise ValueError(
-                            "role=Admin requires base_role column set to Instructor or Cadet"
-                        )
-                    if base_role_raw not in ROLE_MAP or ROLE_MAP[base_role_raw] not in BASE_ROLES:
-                        raise ValueError(
-                            f"base_role must be Instructor or Cadet when role=Admin: {normalized_row.get('base_role')!r}")
-                    role = ROLE_MAP[base_role_raw]
-                    is_admin = True
-                if is_admin and role not in BASE_ROLES:
-                    raise ValueError("is_admin can only be true when role is Instructor or Cadet")
-
-                user = None
-                if telegram_id is not None:
-                    user = session.query(User).filter_by(telegram_id=telegram_id).first()
-                if user is None and telegram_username:
-                    user = session.query(User).filter_by(telegram_username=telegram_username).first()
-                if not user:
-                    user = User()
-                    session.add(user)
-                    created += 1
-                else:
-                    updated += 1
-
-                if telegram_id is not None:
-                    user.telegram_id = telegram_id
-                if telegram_username:
-                    user.telegram_username = telegram_username
-                user.full_name = full_name
-                user.rank = rank
-                user.role = role
-                user.is_admin = is_admin
-                is_active = normalized_row.get("is_active", "true")
-                user.is_active = str(is_active).lower() != "false"
-
-        session.commit()
-        return {"processed": processed, "created": created, "updated": updated}
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+    now = now_sg()
+
+    for values in rows:
+        target = index.find(values)
+        if target is None:
+            # Rows later in the same file that match this user update the pending insert.
+            target = {"telegram_id": None, "telegram_username": None, "created_at": now}
+            inserts.append(target)
+            created += 1
+        else:
+            if "user_id" in target:
+                updates[target["user_id"]] = target
+            updated += 1
+        target.update(values)
+        target["updated_at"] = now
+        index.register(values, target)
+
+    # Core executemany: the ORM bulk path falls back to one statement per row
+    # when parameter sets differ in which values are None.
+    users = User.__table__
+    if inserts:
+        ids = session.execute(
+            users.insert().returning(users.c.id, sort_by_parameter_order=True),
+            inserts,
+        ).scalars().all()
+        # Inserted users become update targets for any later chunk.
+        for target, user_id in zip(inserts, ids):
+            del target["created_at"]
+            target["user_id"] = user_id
+    if updates:
+        session.execute(
+            users.update().where(users.c.id == bindparam("user_id")),
+            list(updates.values()),
+        )
+    return created, updated
+
+
+def import_users(source, require_username=False):
+    """
+    Import a CSV path or stream in one transaction; any invalid row aborts it.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    with _open_source(source) as f:
+        reader = csv.reader(f)
+        fieldnames = _read_header(reader, require_username)
+        rows = list(_parse_rows(reader, fieldnames, require_username))
+    timings["parse_ms"] = (time.perf_counter() - started) * 1000
+
+    with session_scope() as session:
+        started = time.perf_counter()
+        index = _UserIndex(session)
+        timings["load_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        created, updated = _upsert(session, rows, index)
+        on_commit(session, parade_aggregate.invalidate)
+        on_commit(session, roster_cache.invalidate)
+    timings["write_ms"] = (time.perf_counter() - started) * 1000
+
+    logger.info(
+        "Imported %d users (parse %.1f ms, load %.1f ms, write %.1f ms)",
+        len(rows), timings["parse_ms"], timings["load_ms"], timings["write_ms"],
+    )
+    return {
+        "processed": len(rows),
+        "created": created,
+        "updated": updated,
+        "timings": timings,
+    }
+
+
+def iter_import_users(source, chunk_size=IMPORT_CSV_CHUNK_SIZE, require_username=False):
+    """
+    Stream a CSV path or stream and upsert it chunk by chunk, committing after each chunk.
+    Yields a progress dict after every commit. Invalid rows are skipped and
+    listed in "errors" as (line, message); a bad header still raises ValueError.
+    Blocking; drive it with run_db(next, ...) from the bot.
+    """
+    progress = {
+        "processed": 0,
+        "created": 0,
+        "updated": 0,
+        "estimated_total": _estimate_rows(source),
+        "errors": [],
+    }
+
+    with _open_source(source) as f:
+        reader = csv.reader(f)
+        fieldnames = _read_header(reader, require_username)
+        rows = _parse_rows(reader, fieldnames, require_username, progress["errors"])
+
+        with session_scope() as session:
+            index = _UserIndex(session)
+
+        reported = None
+        while chunk := list(islice(rows, chunk_size)):
+            with session_scope() as session:
+                created, updated = _upsert(session, chunk, index)
+                on_commit(session, parade_aggregate.invalidate)
+                on_commit(session, roster_cache.invalidate)
+            progress["processed"] += len(chunk)
+            progress["created"] += created
+            progress["updated"] += updated
+            reported = {**progress, "errors": list(progress["errors"])}
+            yield reported
+
+        # Invalid rows after the last chunk (or an all-invalid file) still get reported.
+        final = {**progress, "errors": list(progress["errors"])}
+        if final != reported:
+            yield final
 
 
 if __name__ == "__main__":
@@ -171,3 +375,7 @@ if __name__ == "__main__":
         "Import complete.",
         f"Processed: {result['processed']}, created: {result['created']}, updated: {result['updated']}",
     )
+    print(
+        "Timings:",
+        ", ".join(f"{phase} {ms:.1f}" for phase, ms in result["timings"].items()),
+    )
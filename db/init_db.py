@@ -1,8 +1,39 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
 from db.database import engine
 from db.models import Base
 
+def ensure_indexes():
+    """create_all skips tables that already exist, so add any missing indexes to them."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                # IF NOT EXISTS also covers expression indexes, which reflection cannot see.
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+def ensure_columns():
+    """create_all never alters existing tables, so add nullable columns added to models since."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    raise RuntimeError(
+                        f"Cannot add NOT NULL column {table.name}.{column.name} to an existing table"
+                    )
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                ))
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    ensure_columns()
+    ensure_indexes()
 
 if __name__ == "__main__":
     init_db()
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import BigInteger, Column, Integer, String, Boolean, Date, DateTime, Text, ForeignKey
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, Date, DateTime, Text, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from utils.datetime_utils import now_sg
 
@@ -26,7 +26,15 @@ class User(Base):
     
     medical_statuses = relationship("MedicalStatus", back_populates="user")
     medical_events = relationship("MedicalEvent", back_populates="user")
-    
+
+    __table_args__ = (
+        Index("ix_users_rank_full_name", "rank", "full_name"),
+        Index("ix_users_telegram_username", "telegram_username"),
+    )
+
+# Roster lookups filter on lower(role), so index the expression itself.
+Index("ix_users_lower_role_active", func.lower(User.role), User.is_active)
+
 # class Cadet(Base):
 #     __tablename__ = 'cadets'
     
@@ -74,6 +82,12 @@ class MedicalEvent(Base):
     statuses = relationship("MedicalStatus", back_populates="source_event")
     
     user = relationship("User", back_populates="medical_events")
+
+    __table_args__ = (
+        Index("ix_medical_events_user_type", "user_id", "event_type"),
+        Index("ix_medical_events_type_diagnosis", "event_type", "diagnosis"),
+        Index("ix_medical_events_event_datetime", "event_datetime"),
+    )
     
 class MedicalStatus(Base):
     __tablename__ = "medical_statuses"
@@ -92,6 +106,11 @@ class MedicalStatus(Base):
     
     user = relationship("User", back_populates="medical_statuses")
     source_event = relationship("MedicalEvent", back_populates="statuses")
+
+    __table_args__ = (
+        Index("ix_medical_statuses_dates", "end_date", "start_date"),
+        Index("ix_medical_statuses_source_event", "source_event_id"),
+    )
     
 class SftSessions(Base):
     __tablename__ = "sft_sessions"
@@ -100,5 +119,31 @@ class SftSessions(Base):
 
     start_datetime = Column(DateTime, nullable=False, default=now_sg)
     end_datetime = Column(DateTime, nullable=False, default=now_sg)
+    label = Column(String, nullable=True)       # e.g. AM / PM / platoon
+    closed_at = Column(DateTime, nullable=True)  # NULL while the window is open
+
+    created_at = Column(DateTime, default=now_sg)
+
+    submissions = relationship("SftSubmissions", back_populates="sft_session")
+
+class SftSubmissions(Base):
+    __tablename__ = "sft_submissions"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey("sft_sessions.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    user_name = Column(String, nullable=False)
+    activity = Column(String, nullable=False)
+    location = Column(String, nullable=False, default="")
+    start = Column(String, nullable=False)  # HHMM
+    end = Column(String, nullable=False)    # HHMM
 
     created_at = Column(DateTime, default=now_sg)
+
+    sft_session = relationship("SftSessions", back_populates="submissions")
+
+    __table_args__ = (
+        Index("ix_sft_submissions_session_user", "session_id", "user_id"),
+        Index("ix_sft_submissions_user", "user_id"),
+    )
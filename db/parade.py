@@ -1,40 +1,314 @@
-from datetime import date
-from db.models import User, MedicalEvent, MedicalStatus
-
-def generate_parade_state(db, target_date: date):
-    # --- Strength ---
-    total_strength = db.query(User).filter(
-        User.role == "Cadet",
-        User.is_active == True
-    ).count()
-
-    # --- Active statuses ---
-    active_statuses = db.query(MedicalStatus).filter(
-        MedicalStatus.start_date <= target_date,
-        MedicalStatus.end_date >= target_date
-    ).all()
-
-    # --- Count by status type ---
-    status_counts = {}
-    status_text = {}
-
-    for status in active_statuses:
-        status_counts.setdefault(status.status_type, 0)
-        status_counts[status.status_type] += 1
-
-        status_text.setdefault(status.status_type, [])
-        status_text[status.status_type].append(
-            f"{status.user.full_name} ({status.start_date.strftime('%d%m%y')}-"
-            f"{status.end_date.strftime('%d%m%y')})"
+import logging
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from db.database import session_scope
+
+logger = logging.getLogger(__name__)
+
+PARADE_EVENT_TYPES = ("MA", "RSO", "RSI")
+
+
+def _naive(value: datetime | None) -> datetime | None:
+    # SQLite hands back naive datetimes; freshly written rows may still carry SG_TZ.
+    if value is None or value.tzinfo is None:
+        return value
+    return value.replace(tzinfo=None)
+
+
+# =========================
+# ENTRIES
+# =========================
+
+@dataclass(frozen=True)
+class ParadeEvent:
+    id: int
+    user_id: int
+    event_type: str
+    rank: str
+    full_name: str
+    symptoms: str | None
+    diagnosis: str | None
+    appointment_type: str | None
+    location: str | None
+    endorsed_by: str | None
+    event_datetime: datetime
+
+    @classmethod
+    def from_rows(cls, event, user) -> "ParadeEvent":
+        return cls(
+            id=event.id,
+            user_id=event.user_id,
+            event_type=event.event_type,
+            rank=user.rank,
+            full_name=user.full_name,
+            symptoms=event.symptoms,
+            diagnosis=event.diagnosis,
+            appointment_type=event.appointment_type,
+            location=event.location,
+            endorsed_by=event.endorsed_by,
+            event_datetime=_naive(event.event_datetime),
+        )
+
+    @property
+    def undiagnosed(self) -> bool:
+        return not self.diagnosis
+
+
+@dataclass(frozen=True)
+class ParadeStatus:
+    id: int
+    user_id: int
+    status_type: str
+    rank: str
+    full_name: str
+    symptoms: str | None
+    diagnosis: str | None
+    start_date: date
+    end_date: date
+    event_datetime: datetime
+
+    @classmethod
+    def from_rows(cls, status, user, event) -> "ParadeStatus":
+        return cls(
+            id=status.id,
+            user_id=status.user_id,
+            status_type=status.status_type,
+            rank=user.rank,
+            full_name=user.full_name,
+            symptoms=event.symptoms,
+            diagnosis=event.diagnosis,
+            start_date=status.start_date,
+            end_date=status.end_date,
+            event_datetime=_naive(event.event_datetime),
         )
 
-    current_strength = total_strength - len(active_statuses)
-    out_of_camp = status_counts.get("RSO", 0)
+    def active_on(self, day: date) -> bool:
+        return self.start_date <= day <= self.end_date
+
+
+@dataclass(frozen=True)
+class UserParadeStatus:
+    events: tuple[ParadeEvent, ...]       # undiagnosed events
+    statuses: tuple[ParadeStatus, ...]    # statuses active today
+
+
+@dataclass(frozen=True)
+class ParadeSnapshot:
+    events: dict[str, list[ParadeEvent]]      # event_type -> undiagnosed events
+    statuses: dict[str, list[ParadeStatus]]   # status_type -> statuses active today
+    total_strength: int
+
+
+# =========================
+# AGGREGATE
+# =========================
+
+class ParadeStateAggregate:
+    """
+    Parade state kept current by the crud write functions, so generating it
+    only renders what is already here instead of re-querying history.
+    Holds undiagnosed MA/RSO/RSI events and every status that has not expired,
+    plus which of them belong to each user.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: dict[int, ParadeEvent] = {}
+        self._statuses: dict[int, ParadeStatus] = {}
+        self._events_by_user: dict[int, set[int]] = defaultdict(set)
+        self._statuses_by_user: dict[int, set[int]] = defaultdict(set)
+        self._total_strength = 0
+        self._ready = False
+        self._mutations = 0
+
+    # ---------- BUILD ----------
+
+    def rebuild(self, today: date | None = None):
+        """Reload everything from the DB. Blocking; run off the event loop."""
+        from db import crud
+        from utils.datetime_utils import now_sg
+
+        today = today or now_sg().date()
+        with self._lock:
+            started_at = self._mutations
+
+        with session_scope() as session:
+            events = {
+                event.id: ParadeEvent.from_rows(event, user)
+                for event, user in crud.get_undiagnosed_events(session=session)
+            }
+            statuses = {
+                status.id: ParadeStatus.from_rows(status, user, event)
+                for status, user, event in crud.get_unexpired_statuses(today, session=session)
+            }
+            total_strength = crud.count_active_cadets(session=session)
+
+        with self._lock:
+            self._events = events
+            self._statuses = statuses
+            self._reindex_users()
+            self._total_strength = total_strength
+            # A write that committed while we were reading may be missing; rebuild again next time.
+            self._ready = self._mutations == started_at
+
+    def _reindex_users(self):
+        self._events_by_user = defaultdict(set)
+        self._statuses_by_user = defaultdict(set)
+        for entry in self._events.values():
+            self._events_by_user[entry.user_id].add(entry.id)
+        for entry in self._statuses.values():
+            self._statuses_by_user[entry.user_id].add(entry.id)
+
+    def invalidate(self):
+        with self._lock:
+            self._mutations += 1
+            self._ready = False
+
+    # ---------- WRITE HOOKS ----------
+
+    def record_event(self, entry: ParadeEvent):
+        with self._lock:
+            self._mutations += 1
+            if entry.event_type in PARADE_EVENT_TYPES and entry.undiagnosed:
+                self._events[entry.id] = entry
+                self._events_by_user[entry.user_id].add(entry.id)
+            else:
+                self._events.pop(entry.id, None)
+                self._events_by_user[entry.user_id].discard(entry.id)
+
+    def record_status(self, entry: ParadeStatus):
+        with self._lock:
+            self._mutations += 1
+            self._statuses[entry.id] = entry
+            self._statuses_by_user[entry.user_id].add(entry.id)
+
+    def prune(self, before: date):
+        """Mirror delete_expired_statuses_and_events(before)."""
+        cutoff = datetime.combine(before, datetime.min.time())
+        with self._lock:
+            self._mutations += 1
+            # Statuses whose source event is deleted drop out of the parade state join too.
+            self._statuses = {
+                key: value for key, value in self._statuses.items()
+                if value.end_date >= before and value.event_datetime >= cutoff
+            }
+            self._events = {
+                key: value for key, value in self._events.items()
+                if value.event_datetime >= cutoff
+            }
+            self._reindex_users()
+
+    # ---------- READ ----------
+    #
+    # The peek_ reads return None instead of rebuilding when a write has made
+    # the aggregate stale, so the event loop can serve from memory and hand
+    # anything else to the DB executor. The plain reads rebuild; they block.
+
+    def peek_snapshot(self, today: date) -> ParadeSnapshot | None:
+        with self._lock:
+            return self._snapshot(today) if self._ready else None
+
+    def snapshot(self, today: date) -> ParadeSnapshot:
+        if not self._ready:
+            self.rebuild(today)
+        with self._lock:
+            return self._snapshot(today)
+
+    def peek_user_statuses(self, user_ids, today: date) -> dict[int, UserParadeStatus] | None:
+        with self._lock:
+            return self._user_statuses(user_ids, today) if self._ready else None
+
+    def user_statuses(self, user_ids, today: date) -> dict[int, UserParadeStatus]:
+        if not self._ready:
+            self.rebuild(today)
+        with self._lock:
+            return self._user_statuses(user_ids, today)
+
+    def peek_users_with_status(self, today: date) -> set[int] | None:
+        with self._lock:
+            return self._users_with_status(today) if self._ready else None
+
+    def users_with_status(self, today: date) -> set[int]:
+        if not self._ready:
+            self.rebuild(today)
+        with self._lock:
+            return self._users_with_status(today)
+
+    # Callers hold _lock.
+
+    def _snapshot(self, today: date) -> ParadeSnapshot:
+        events = defaultdict(list)
+        statuses = defaultdict(list)
+        for entry in sorted(self._events.values(), key=lambda e: e.id):
+            events[entry.event_type].append(entry)
+        for entry in sorted(self._statuses.values(), key=lambda s: s.id):
+            if entry.active_on(today):
+                statuses[entry.status_type].append(entry)
+        return ParadeSnapshot(
+            events=dict(events),
+            statuses=dict(statuses),
+            total_strength=self._total_strength,
+        )
+
+    def _user_statuses(self, user_ids, today: date) -> dict[int, UserParadeStatus]:
+        """What each of these users currently has open, keyed by user id."""
+        result = {}
+        for user_id in user_ids:
+            events = [self._events[key] for key in self._events_by_user.get(user_id, ())]
+            statuses = [
+                self._statuses[key] for key in self._statuses_by_user.get(user_id, ())
+                if self._statuses[key].active_on(today)
+            ]
+            result[user_id] = UserParadeStatus(
+                events=tuple(sorted(events, key=lambda e: e.id)),
+                statuses=tuple(sorted(statuses, key=lambda s: s.id)),
+            )
+        return result
+
+    def _users_with_status(self, today: date) -> set[int]:
+        """Users with an undiagnosed event or a status active today."""
+        users = {user_id for user_id, ids in self._events_by_user.items() if ids}
+        users.update(
+            entry.user_id for entry in self._statuses.values() if entry.active_on(today)
+        )
+        return users
+
+    def verify(self, today: date) -> bool:
+        """Compare against a full recompute from the DB. Blocking."""
+        from db import crud
+
+        snapshot = self.snapshot(today)
+        rows = crud.get_parade_state_rows(today)
+
+        expected_events = sorted(event.id for event, _ in rows["events"])
+        expected_statuses = sorted(status.id for status, _, _ in rows["statuses"])
+        actual_events = sorted(e.id for entries in snapshot.events.values() for e in entries)
+        actual_statuses = sorted(s.id for entries in snapshot.statuses.values() for s in entries)
+
+        ok = (
+            expected_events == actual_events
+            and expected_statuses == actual_statuses
+            and rows["total_strength"] == snapshot.total_strength
+        )
+        if not ok:
+            logger.warning(
+                "Parade state aggregate drifted: events %s vs %s, statuses %s vs %s, strength %s vs %s",
+                actual_events, expected_events,
+                actual_statuses, expected_statuses,
+                snapshot.total_strength, rows["total_strength"],
+            )
+        return ok
+
+
+parade_aggregate = ParadeStateAggregate()
+
+
+if __name__ == "__main__":
+    from utils.datetime_utils import now_sg
 
-    return {
-        "total_strength": total_strength,
-        "current_strength": current_strength,
-        "out_of_camp": out_of_camp,
-        "status_counts": status_counts,
-        "status_text": status_text,
-    }
+    today = now_sg().date()
+    parade_aggregate.rebuild(today)
+    print("Parade state aggregate matches DB:", parade_aggregate.verify(today))
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import Mapping
+
+from db.database import session_scope
+
+logger = logging.getLogger(__name__)
+
+# Rosters kept resolvable by version: the current one plus the one before it,
+# so menus opened just before an import still resolve to the names they showed.
+ROSTER_HISTORY = 2
+
+
+# =========================
+# ENTRIES
+# =========================
+
+@dataclass(frozen=True)
+class RosterEntry:
+    id: int
+    telegram_id: int | None
+    telegram_username: str | None
+    rank: str
+    full_name: str
+    role: str
+    is_admin: bool
+    is_active: bool
+
+    @property
+    def display_name(self) -> str:
+        return f"{self.rank} {self.full_name}"
+
+
+class NameIndex:
+    """
+    Sorted prefix index over the words of each entry's rank and full name.
+    A query matches entries where every query word starts some name word;
+    each word is two bisects, whatever the roster size.
+    """
+
+    def __init__(self, entries: tuple[RosterEntry, ...]):
+        self._entries = entries
+        pairs = sorted({
+            (word, position)
+            for position, entry in enumerate(entries)
+            for word in entry.display_name.lower().split()
+        })
+        self._words = [word for word, _ in pairs]
+        self._positions = [position for _, position in pairs]
+
+    def _starting_with(self, prefix: str) -> set[int]:
+        low = bisect_left(self._words, prefix)
+        high = bisect_right(self._words, prefix + "\U0010ffff", low)
+        return set(self._positions[low:high])
+
+    def search(self, query: str) -> tuple[RosterEntry, ...]:
+        """Matching entries in roster order; an empty query matches everyone."""
+        words = query.lower().split()
+        if not words:
+            return self._entries
+
+        matches = None
+        # Longest words first: they narrow the set the most.
+        for word in sorted(set(words), key=len, reverse=True):
+            found = self._starting_with(word)
+            matches = found if matches is None else matches & found
+            if not matches:
+                return ()
+        return tuple(self._entries[position] for position in sorted(matches))
+
+
+@dataclass(frozen=True)
+class Roster:
+    version: int
+    users: tuple[RosterEntry, ...]
+    cadets: tuple[RosterEntry, ...]        # active cadets
+    instructors: tuple[RosterEntry, ...]
+    by_id: Mapping[int, RosterEntry]
+    by_telegram_id: Mapping[int, RosterEntry]
+
+    @cached_property
+    def cadet_index(self) -> NameIndex:
+        return NameIndex(self.cadets)
+
+    @cached_property
+    def instructor_index(self) -> NameIndex:
+        return NameIndex(self.instructors)
+
+
+# =========================
+# CACHE
+# =========================
+
+class RosterCache:
+    """
+    Immutable snapshot of the users table, built on first use and dropped
+    whenever crud or the CSV import changes users. The version number moves
+    on every invalidation so callers holding an older Roster can tell it is stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roster: Roster | None = None
+        self._recent: OrderedDict[int, Roster] = OrderedDict()
+        # Versions are persisted in user_data, so start past any earlier run's.
+        self._version = time.time_ns() // 1_000_000
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def peek(self) -> Roster | None:
+        """The current roster if it is built, without touching the DB."""
+        return self._roster
+
+    def resolve(self, version: int | None) -> Roster | None:
+        """The roster built at version, if it is still held."""
+        return self._recent.get(version)
+
+    def get(self) -> Roster:
+        """The current roster, building it if needed. Blocking; run off the event loop."""
+        roster = self._roster
+        if roster is not None:
+            return roster
+
+        from db import crud
+
+        version = self._version
+        with session_scope() as session:
+            users = tuple(
+                RosterEntry(
+                    id=user.id,
+                    telegram_id=user.telegram_id,
+                    telegram_username=user.telegram_username,
+                    rank=user.rank,
+                    full_name=user.full_name,
+                    role=user.role,
+                    is_admin=bool(user.is_admin),
+                    is_active=bool(user.is_active),
+                )
+                for user in crud.get_roster_users(session=session)
+            )
+        roster = Roster(
+            version=version,
+            users=users,
+            cadets=tuple(
+                entry for entry in users
+                if entry.role.lower() == "cadet" and entry.is_active
+            ),
+            instructors=tuple(
+                entry for entry in users if entry.role.lower() == "instructor"
+            ),
+            by_id=MappingProxyType({entry.id: entry for entry in users}),
+            by_telegram_id=MappingProxyType({
+                entry.telegram_id: entry
+                for entry in users if entry.telegram_id is not None
+            }),
+        )
+
+        # Build the search indexes here, off the event loop.
+        roster.cadet_index
+        roster.instructor_index
+
+        with self._lock:
+            # Users changed while we were reading; hand this one out but don't keep it.
+            if self._version == version:
+                self._roster = roster
+                self._recent[version] = roster
+                while len(self._recent) > ROSTER_HISTORY:
+                    self._recent.popitem(last=False)
+        logger.info("Roster v%d built: %d users", version, len(users))
+        return roster
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._roster = None
+
+
+roster_cache = RosterCache()
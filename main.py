@@ -1,12 +1,13 @@
 from email.mime import application
 from config.settings import BOT_TOKEN
-from config.constants import IC_GROUP_CHAT_ID
+from config.constants import ADMIN_RECONCILE_INTERVAL_SECONDS, CONCURRENT_UPDATES, IC_GROUP_CHAT_ID
 from services.db_service import DatabaseService
 
 from bot.commands import (
     start,
     start_sft,
     quit_sft,
+    sft_status,
     start_movement,
     start_status,
     start_parade_state,
@@ -22,10 +23,22 @@ from bot.callbacks import (
 )
 
 from bot.cet import cet_handler
+from bot.keyboards import name_page_handler
+from bot.identity import register_identity_handler
+from bot.inline_status import register_inline_status_handler
 from bot.daily_msg import send_daily_msg
 from core.pt_sft_admin import start_pt_admin, handle_pt_admin_callbacks
+from core.sft_manager import close_expired_windows_job
+from services.auth_service import reconcile_admins_job
+from services.persistence import SQLitePersistence
+from utils.rate_limiter import (
+    RATE_LIMIT_BACKEND,
+    SQLITE_SWEEP_INTERVAL_SECONDS,
+    SQLiteBackend,
+    sweep_rate_limits_job,
+)
 
-from utils.time_utils import SG_TZ, DAILY_MSG_TIME
+from utils.time_utils import SG_TZ, DAILY_MSG_TIME, SFT_EXPIRE_TIME
 
 from telegram.ext import (
     ApplicationBuilder,
@@ -50,9 +63,16 @@ def main():
     application = (
         ApplicationBuilder()
         .token(BOT_TOKEN)
+        .persistence(SQLitePersistence())
+        .concurrent_updates(CONCURRENT_UPDATES)
         .build()
     )
 
+    # -----------------------------
+    # Identity (runs before every handler)
+    # -----------------------------
+    register_identity_handler(application)
+
     # -----------------------------
     # Command Handlers
     # -----------------------------
@@ -69,6 +89,7 @@ def main():
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("start_sft", start_sft))
     application.add_handler(CommandHandler("quit_sft", quit_sft))
+    application.add_handler(CommandHandler("sft_status", sft_status))
     application.add_handler(CommandHandler("start_status", start_status))
     application.add_handler(CommandHandler("start_movement", start_movement))
     application.add_handler(CommandHandler("pt_admin", start_pt_admin))
@@ -76,6 +97,7 @@ def main():
     application.add_handler(CommandHandler("start_parade_state", start_parade_state))
     application.add_handler(CommandHandler("import_user", import_user))
     register_status_handlers(application)
+    register_inline_status_handler(application)
 
 
     # -----------------------------
@@ -87,6 +109,9 @@ def main():
     application.add_handler(
         CallbackQueryHandler(callback_router, pattern=r"^(mov|sft|parade)")
     )
+    application.add_handler(
+        CallbackQueryHandler(name_page_handler, pattern=r"^namepage\|")
+    )
     application.add_handler(
         MessageHandler(filters.TEXT & ~filters.COMMAND, text_input_router)
     )
@@ -107,12 +132,38 @@ def main():
         time=DAILY_MSG_TIME,
     )
 
+    # -----------------------------
+    # Job Queue (Close Yesterday's SFT Windows)
+    # -----------------------------
+    application.job_queue.run_daily(
+        close_expired_windows_job,
+        time=SFT_EXPIRE_TIME,
+    )
+
+    # -----------------------------
+    # Job Queue (Admin Reconcile)
+    # -----------------------------
+    if ADMIN_RECONCILE_INTERVAL_SECONDS:
+        application.job_queue.run_repeating(
+            reconcile_admins_job,
+            interval=ADMIN_RECONCILE_INTERVAL_SECONDS,
+        )
+
+    # -----------------------------
+    # Job Queue (Rate Limit Sweep)
+    # -----------------------------
+    if RATE_LIMIT_BACKEND == SQLiteBackend.name:
+        application.job_queue.run_repeating(
+            sweep_rate_limits_job,
+            interval=SQLITE_SWEEP_INTERVAL_SECONDS,
+        )
+
     # -----------------------------
     # Start Bot (Polling)
     # -----------------------------
     application.run_polling(
         drop_pending_updates=True,
-        allowed_updates=["message", "callback_query"],
+        allowed_updates=["message", "callback_query", "inline_query"],
     )
 
 
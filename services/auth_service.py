@@ -1,17 +1,66 @@
+import logging
+import threading
+
 from config.constants import ADMIN_IDS
-from db.crud import get_admin_telegram_ids, get_user_by_telegram_id
+from db.async_crud import get_roster, run_db
+from db.crud import get_admin_telegram_ids
+from db.roster import roster_cache
+
+logger = logging.getLogger(__name__)
+
+
+class AdminRegistry:
+    """
+    Telegram ids allowed admin actions: the static ADMIN_IDS plus active DB
+    admins. Derived from the shared roster and rebuilt only when its version
+    moves, so a check is a set lookup.
+    """
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: frozenset[int] = frozenset(ADMIN_IDS)
+        self._version: int | None = None
 
-def is_admin_user(user_id: int | None) -> bool:
-    if user_id is None:
+    def sync(self, roster) -> frozenset[int]:
+        """Admin ids for roster, recomputed only if it is newer than the last one seen."""
+        if self._version is None or roster.version > self._version:
+            ids = frozenset(ADMIN_IDS) | {
+                entry.telegram_id
+                for entry in roster.users
+                if entry.is_admin and entry.is_active and entry.telegram_id is not None
+            }
+            with self._lock:
+                if self._version is None or roster.version > self._version:
+                    self._ids = ids
+                    self._version = roster.version
+        return self._ids
+
+    def is_admin(self, user_id: int | None, roster) -> bool:
+        return user_id is not None and user_id in self.sync(roster)
+
+    def reconcile(self) -> bool:
+        """
+        Compare against a direct DB query. On drift, drop the roster so the
+        next check rebuilds from the DB. Blocking; run off the event loop.
+        """
+        expected = frozenset(ADMIN_IDS) | frozenset(get_admin_telegram_ids())
+        actual = self.sync(roster_cache.get())
+        if expected == actual:
+            return True
+        logger.warning(
+            "Admin registry drifted: missing %s, extra %s",
+            sorted(expected - actual), sorted(actual - expected),
+        )
+        roster_cache.invalidate()
         return False
 
-    if user_id in ADMIN_IDS:
-        return True
 
-    user = get_user_by_telegram_id(user_id)
-    return bool(user and user.is_admin and user.is_active)
+admin_registry = AdminRegistry()
+
+
+async def list_admin_user_ids() -> list[int]:
+    return sorted(admin_registry.sync(await get_roster()))
 
 
-def get_all_admin_user_ids() -> list[int]:
-    return sorted(set(ADMIN_IDS) | set(get_admin_telegram_ids()))
+async def reconcile_admins_job(context):
+    await run_db(admin_registry.reconcile)
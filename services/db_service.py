@@ -1,6 +1,17 @@
-from collections import defaultdict
-from dataclasses import dataclass
-from typing import List, Optional
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass, replace
+from datetime import date, datetime
+from functools import cached_property
+from typing import Dict, List, Optional, Set, Tuple
+
+from config.constants import SFT_MIN_PARTICIPANTS, SFT_SLOT_MINUTES
+from db import crud
+from utils.datetime_utils import now_sg
+from utils.time_utils import hhmm_to_minutes
+
+WINDOW_DATE_FORMAT = "%d%m%Y"
+
 
 def _display_instructor_name(instructor_name: str) -> str:
     parts = instructor_name.split(maxsplit=1)
@@ -22,6 +33,12 @@ class SFTSubmission:
     start: str
     end: str
     date: str
+    id: Optional[int] = None
+    window_id: Optional[int] = None
+
+    @property
+    def activity_key(self) -> str:
+        return f"{self.activity} @ {self.location}" if self.location else self.activity
 
 
 @dataclass
@@ -29,6 +46,43 @@ class SFTWindow:
     date: str
     start: str
     end: str
+    id: Optional[int] = None
+    label: Optional[str] = None
+
+    @property
+    def title(self) -> str:
+        times = f"{self.start}-{self.end}"
+        prefix = f"{self.label} " if self.label else ""
+        return f"{prefix}{times} ({self.date})"
+
+    @cached_property
+    def day(self) -> date:
+        return datetime.strptime(self.date, WINDOW_DATE_FORMAT).date()
+
+    def expired(self, today: date) -> bool:
+        """Windows only run on their own day."""
+        return self.day < today
+
+    @property
+    def slot_count(self) -> int:
+        return (hhmm_to_minutes(self.end) - hhmm_to_minutes(self.start)) // SFT_SLOT_MINUTES
+
+    def slot_range(self, start: str, end: str) -> range:
+        """Indexes of the slots that [start, end) overlaps."""
+        base = hhmm_to_minutes(self.start)
+        first = (hhmm_to_minutes(start) - base) // SFT_SLOT_MINUTES
+        last = -(-(hhmm_to_minutes(end) - base) // SFT_SLOT_MINUTES)
+        return range(max(first, 0), min(last, self.slot_count))
+
+    @classmethod
+    def from_row(cls, row) -> "SFTWindow":
+        return cls(
+            date=row.start_datetime.strftime(WINDOW_DATE_FORMAT),
+            start=row.start_datetime.strftime("%H%M"),
+            end=row.end_datetime.strftime("%H%M"),
+            id=row.id,
+            label=row.label,
+        )
 
 
 # =========================
@@ -39,7 +93,10 @@ class DatabaseService:
     @staticmethod
     def initialise():
         from db.init_db import init_db
+        from db.parade import parade_aggregate
         init_db()
+        parade_aggregate.rebuild()
+        SFTService.load()
 
 
 # =========================
@@ -47,28 +104,167 @@ class DatabaseService:
 # =========================
 
 class SFTService:
-    _submissions: List[SFTSubmission] = []
-    _window: Optional[SFTWindow] = None
+    """
+    Open SFT windows and their submissions, persisted in sft_sessions /
+    sft_submissions. Several windows can be open at once (AM/PM, platoons),
+    each with its own submissions. Writes go to the DB first and then to the
+    in-memory indexes, so reads never touch the DB. Writes block; call them
+    through run_db.
+
+    A window closes once its day is over: reads skip it straight away, and
+    close_expired (run at midnight and on load) closes it in the DB.
+
+    Per window, each activity also keeps a live headcount and an occupancy
+    histogram: how many of its cadets are out in each SFT_SLOT_MINUTES slot.
+    """
+
+    _lock = threading.Lock()
+    _windows: Dict[int, SFTWindow] = {}                   # open windows by id
+    _open: Tuple[SFTWindow, ...] = ()                      # same, in opening order
+    _by_id: Dict[int, SFTSubmission] = {}
+    _by_window: Dict[int, Dict[int, SFTSubmission]] = {}   # window id -> submission id -> submission
+    _by_user: Dict[int, Set[int]] = defaultdict(set)       # user_id -> submission ids
+    _occupancy: Dict[int, Dict[str, List[int]]] = {}       # window id -> activity -> count per slot
+    _headcount: Dict[int, Counter] = {}                    # window id -> activity -> submissions
+
+    @classmethod
+    def load(cls):
+        """Rebuild open windows and indexes from the DB. Blocking."""
+        today = now_sg().date()
+        sessions = []
+        for row in crud.get_open_sft_sessions():
+            if row.start_datetime.date() < today:
+                crud.close_sft_session(row.id)
+            else:
+                sessions.append(row)
+        rows = crud.get_open_sft_submissions()
+        with cls._lock:
+            cls._windows = {}
+            cls._open = ()
+            cls._by_id = {}
+            cls._by_window = {}
+            cls._by_user = defaultdict(set)
+            cls._occupancy = {}
+            cls._headcount = {}
+            for row in sessions:
+                cls._add_window(SFTWindow.from_row(row))
+            for row in rows:
+                cls._index(SFTSubmission(
+                    user_id=row.user_id,
+                    user_name=row.user_name,
+                    activity=row.activity,
+                    location=row.location,
+                    start=row.start,
+                    end=row.end,
+                    date=cls._windows[row.session_id].date,
+                    id=row.id,
+                    window_id=row.session_id,
+                ))
+
+    @classmethod
+    def _add_window(cls, window: SFTWindow):
+        cls._windows[window.id] = window
+        cls._by_window[window.id] = {}
+        cls._occupancy[window.id] = {}
+        cls._headcount[window.id] = Counter()
+        cls._open = tuple(cls._windows.values())
+
+    @classmethod
+    def _index(cls, submission: SFTSubmission):
+        cls._by_id[submission.id] = submission
+        cls._by_window[submission.window_id][submission.id] = submission
+        cls._by_user[submission.user_id].add(submission.id)
+
+        window = cls._windows[submission.window_id]
+        key = submission.activity_key
+        counts = cls._occupancy[window.id].setdefault(key, [0] * window.slot_count)
+        for slot in window.slot_range(submission.start, submission.end):
+            counts[slot] += 1
+        cls._headcount[window.id][key] += 1
+
+    @classmethod
+    def _unindex(cls, submission_id: int):
+        submission = cls._by_id.pop(submission_id)
+        cls._by_window.get(submission.window_id, {}).pop(submission_id, None)
+        ids = cls._by_user.get(submission.user_id)
+        if ids is not None:
+            ids.discard(submission_id)
+            if not ids:
+                del cls._by_user[submission.user_id]
+
+        window = cls._windows.get(submission.window_id)
+        if window is None:
+            return
+        key = submission.activity_key
+        counts = cls._occupancy[window.id][key]
+        for slot in window.slot_range(submission.start, submission.end):
+            counts[slot] -= 1
+        headcount = cls._headcount[window.id]
+        headcount[key] -= 1
+        if not headcount[key]:
+            del headcount[key]
+            del cls._occupancy[window.id][key]
 
     # ---------- WINDOW CONTROL ----------
 
     @classmethod
-    def set_window(cls, date: str, start: str, end: str):
-        cls._window = SFTWindow(date=date, start=start, end=end)
+    def open_window(cls, date: str, start: str, end: str, label: Optional[str] = None) -> SFTWindow:
+        row = crud.create_sft_session(
+            start_datetime=datetime.strptime(date + start, WINDOW_DATE_FORMAT + "%H%M"),
+            end_datetime=datetime.strptime(date + end, WINDOW_DATE_FORMAT + "%H%M"),
+            label=label,
+        )
+        window = SFTWindow(date=date, start=start, end=end, id=row.id, label=label)
+        with cls._lock:
+            cls._add_window(window)
+        return window
+
+    @classmethod
+    def open_windows(cls) -> Tuple[SFTWindow, ...]:
+        today = now_sg().date()
+        return tuple(window for window in cls._open if not window.expired(today))
 
     @classmethod
-    def get_window(cls) -> Optional[SFTWindow]:
-        return cls._window
+    def get_window(cls, window_id: Optional[int] = None) -> Optional[SFTWindow]:
+        """The open window with this id; without an id, the only open window if there is one."""
+        if window_id is None:
+            windows = cls.open_windows()
+            return windows[0] if len(windows) == 1 else None
+        window = cls._windows.get(window_id)
+        if window is None or window.expired(now_sg().date()):
+            return None
+        return window
 
     @classmethod
-    def clear_window(cls):
-        cls._window = None
+    def close_window(cls, window_id: int) -> bool:
+        """Close a window; its submissions stay in the DB but leave memory."""
+        closed = crud.close_sft_session(window_id)
+        with cls._lock:
+            if window_id in cls._windows:
+                for submission_id in list(cls._by_window.get(window_id, {})):
+                    cls._unindex(submission_id)
+                del cls._windows[window_id]
+                cls._by_window.pop(window_id, None)
+                cls._occupancy.pop(window_id, None)
+                cls._headcount.pop(window_id, None)
+                cls._open = tuple(cls._windows.values())
+        return closed
+
+    @classmethod
+    def close_expired(cls) -> List[SFTWindow]:
+        """Close the windows of previous days. Blocking."""
+        today = now_sg().date()
+        expired = [window for window in cls._open if window.expired(today)]
+        for window in expired:
+            cls.close_window(window.id)
+        return expired
 
     # ---------- SUBMISSIONS ----------
 
     @classmethod
     def add_submission(
         cls,
+        window_id: int,
         user_id: int,
         activity: str,
         location: str,
@@ -76,64 +272,144 @@ class SFTService:
         end: str,
         user_name: str,
     ):
-        if not cls._window:
-            raise ValueError("SFT window not set")
-
-        cls._submissions.append(
-            SFTSubmission(
-                user_id=user_id,
-                user_name=user_name,
-                activity=activity,
-                location=location,
-                start=start,
-                end=end,
-                date=cls._window.date,
-            )
+        window = cls.get_window(window_id)
+        if not window:
+            raise ValueError("SFT window is not open")
+
+        row = crud.create_sft_submission(
+            session_id=window.id,
+            user_id=user_id,
+            user_name=user_name,
+            activity=activity,
+            location=location,
+            start=start,
+            end=end,
         )
+        with cls._lock:
+            if window.id in cls._windows:
+                cls._index(SFTSubmission(
+                    user_id=user_id,
+                    user_name=user_name,
+                    activity=activity,
+                    location=location,
+                    start=start,
+                    end=end,
+                    date=window.date,
+                    id=row.id,
+                    window_id=window.id,
+                ))
 
     @classmethod
-    def remove_submission(cls, user_id: int) -> bool:
-        before = len(cls._submissions)
-        cls._submissions = [
-            s for s in cls._submissions if s.user_id != user_id
-        ]
-        return len(cls._submissions) < before
+    def remove_submission(cls, user_id: int, window_id: Optional[int] = None) -> bool:
+        """Remove a user's submissions from one window, or from every open window."""
+        with cls._lock:
+            ids = [
+                submission_id for submission_id in cls._by_user.get(user_id, ())
+                if window_id is None or cls._by_id[submission_id].window_id == window_id
+            ]
+            window_ids = {cls._by_id[submission_id].window_id for submission_id in ids}
+        if not ids:
+            return False
+
+        for open_window_id in window_ids:
+            crud.delete_sft_submissions(user_id=user_id, session_id=open_window_id)
+        with cls._lock:
+            for submission_id in ids:
+                if submission_id in cls._by_id:
+                    cls._unindex(submission_id)
+        return True
 
     @classmethod
-    def clear_submissions(cls):
-        cls._submissions = []
+    def move_submission(cls, submission_id: int, activity: str, location: str) -> bool:
+        """Switch a submission to another activity/location, keeping its times."""
+        with cls._lock:
+            if submission_id not in cls._by_id:
+                return False
+
+        if not crud.update_sft_submission_activity(submission_id, activity, location):
+            return False
+        with cls._lock:
+            # Re-read: another worker may have changed or removed it meanwhile.
+            submission = cls._by_id.get(submission_id)
+            if submission is not None:
+                cls._unindex(submission_id)
+                cls._index(replace(submission, activity=activity, location=location))
+        return True
 
     @classmethod
-    def get_submissions_for_date(cls, date: str) -> List[SFTSubmission]:
-        return [s for s in cls._submissions if s.date == date]
+    def get_submissions(cls, window_id: int) -> List[SFTSubmission]:
+        with cls._lock:
+            return list(cls._by_window.get(window_id, {}).values())
 
-    # ---------- SUMMARY GENERATION ----------
+    # ---------- OCCUPANCY ----------
 
     @classmethod
-    def generate_summary(cls, date: str, instructor_name: str, salutation: str) -> str:
-        grouped = defaultdict(list)
-
-        for s in cls._submissions:
-            if s.date != date:
-                continue
-            key = f"{s.activity} @ {s.location}" if s.location else s.activity
-            grouped[key].append(s)
+    def headcounts(cls, window_id: int) -> Dict[str, int]:
+        with cls._lock:
+            return dict(cls._headcount.get(window_id, {}))
 
-        if not grouped:
-            return f"❌ No SFT submissions for {date}."
+    @classmethod
+    def occupancy(cls, window_id: int) -> Dict[str, Tuple[int, ...]]:
+        with cls._lock:
+            return {
+                key: tuple(counts)
+                for key, counts in cls._occupancy.get(window_id, {}).items()
+            }
 
-        # 🚨 VALIDATION: each activity must have >= 2 pax
-        invalid = [
-            activity
-            for activity, entries in grouped.items()
-            if len(entries) < 2
+    @classmethod
+    def underfilled(cls, window_id: int) -> List[str]:
+        """Activities with fewer than SFT_MIN_PARTICIPANTS submissions."""
+        return [
+            key for key, count in cls.headcounts(window_id).items()
+            if count < SFT_MIN_PARTICIPANTS
         ]
 
+    @classmethod
+    def generate_status(cls, window_id: int) -> str:
+        window = cls._windows.get(window_id)
+        if not window:
+            return "❌ That SFT window is no longer open."
+
+        headcounts = cls.headcounts(window_id)
+        occupancy = cls.occupancy(window_id)
+
+        lines = [f"📊 SFT status: {window.title}"]
+        if not headcounts:
+            lines.append("")
+            lines.append("No submissions yet.")
+            return "\n".join(lines)
+
+        lines.append(f"Each digit is the headcount in one {SFT_SLOT_MINUTES}-min slot.")
+        for key, count in headcounts.items():
+            short = SFT_MIN_PARTICIPANTS - count
+            flag = f" ⚠️ needs {short} more" if short > 0 else ""
+            slots = "".join(str(n) if n < 10 else "+" for n in occupancy[key])
+            lines.append("")
+            lines.append(f"{key}: {count} pax{flag}")
+            lines.append(f"{window.start} {slots} {window.end}")
+
+        return "\n".join(lines)
+
+    # ---------- SUMMARY GENERATION ----------
+
+    @classmethod
+    def generate_summary(cls, window_id: int, instructor_name: str, salutation: str) -> str:
+        window = cls._windows.get(window_id)
+        if not window:
+            return "❌ That SFT window is no longer open."
+        date = window.date
+
+        if not cls.headcounts(window_id):
+            return f"❌ No SFT submissions for {window.title}."
+
+        # 🚨 VALIDATION: each activity must have >= SFT_MIN_PARTICIPANTS pax
+        invalid = cls.underfilled(window_id)
+
         if invalid:
             lines = [
                 "❌ SFT summary cannot be generated.",
                 "",
-                "The following activities have fewer than 2 participants:",
+                f"The following activities have fewer than {SFT_MIN_PARTICIPANTS} participants:",
             ]
             for a in invalid:
                 lines.append(f"- {a}")
@@ -141,6 +417,10 @@ class SFTService:
             lines.append("Please resolve before generating summary.")
             return "\n".join(lines)
 
+        grouped = defaultdict(list)
+        for s in cls.get_submissions(window_id):
+            grouped[s.activity_key].append(s)
+
         all_entries = [entry for entries in grouped.values() for entry in entries]
         earliest = min(entry.start for entry in all_entries)
         latest = max(entry.end for entry in all_entries)
@@ -173,8 +453,5 @@ class SFTService:
 # FUNCTIONAL EXPORT
 # =========================
 
-def get_sft_window():
-    return SFTService.get_window()
-
-def set_sft_window(date: str, start: str, end: str):
-    SFTService.set_window(date=date, start=start, end=end)
+def open_sft_window(date: str, start: str, end: str, label: Optional[str] = None):
+    return SFTService.open_window(date=date, start=start, end=end, label=label)
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config.constants import (
+    PERSISTENCE_UPDATE_INTERVAL_SECONDS,
+    USER_DATA_KEY_TTL_SECONDS,
+    USER_DATA_TTL_SECONDS,
+)
+from db.async_crud import run_db
+from db.database import PROJECT_ROOT
+
+logger = logging.getLogger(__name__)
+
+STATE_DATABASE_PATH = PROJECT_ROOT / "state.db"
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Keeps user_data in state.db so in-progress flows survive a restart.
+
+    PTB hands changed user_data over every update_interval seconds and on
+    shutdown, never per update. A user's row is only rewritten when some key
+    actually changed. Each key is pickled on its own and stamped with when it
+    last changed. A key unchanged for longer than its TTL is not restored.
+    Rows are zlib-compressed pickles.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            payload BLOB NOT NULL,
+            updated REAL NOT NULL
+        )
+    """
+
+    def __init__(
+        self,
+        path=STATE_DATABASE_PATH,
+        update_interval: float = PERSISTENCE_UPDATE_INTERVAL_SECONDS,
+        default_ttl: float = USER_DATA_TTL_SECONDS,
+        key_ttls: dict[str, float] | None = None,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self._default_ttl = default_ttl
+        self._key_ttls = USER_DATA_KEY_TTL_SECONDS if key_ttls is None else key_ttls
+        self._lock = threading.Lock()
+        # user_id -> key -> (digest of the pickled value, changed-at stamp), as last written
+        self._written: dict[int, dict[str, tuple[bytes, float]]] = {}
+
+        self._conn = sqlite3.connect(str(path), isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(self._SCHEMA)
+
+    def _ttl(self, key: str) -> float:
+        return self._key_ttls.get(key, self._default_ttl)
+
+    # ---------- USER DATA ----------
+
+    def _load(self) -> dict[int, dict]:
+        now = time.time()
+        result = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, payload FROM user_data").fetchall()
+            for user_id, payload in rows:
+                try:
+                    entries = pickle.loads(zlib.decompress(payload))
+                except Exception:
+                    logger.warning("Dropping unreadable persisted user_data for %s", user_id)
+                    self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                    continue
+
+                data = {}
+                written = {}
+                for key, (blob, stamp) in entries.items():
+                    if now - stamp > self._ttl(key):
+                        continue
+                    data[key] = pickle.loads(blob)
+                    written[key] = (hashlib.blake2b(blob, digest_size=16).digest(), stamp)
+                if data:
+                    result[user_id] = data
+                    self._written[user_id] = written
+                else:
+                    self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+        logger.info("Restored user_data for %d users", len(result))
+        return result
+
+    @staticmethod
+    def _serialise(user_id: int, data: dict) -> dict[str, bytes]:
+        # Runs on the event loop, so handlers cannot mutate values mid-pickle.
+        blobs = {}
+        for key, value in data.items():
+            try:
+                blobs[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                logger.warning("user_data[%r] for %s cannot be persisted", key, user_id)
+        return blobs
+
+    def _store(self, user_id: int, blobs: dict[str, bytes]):
+        now = time.time()
+        with self._lock:
+            previous = self._written.get(user_id, {})
+            entries = {}
+            written = {}
+            for key, blob in blobs.items():
+                digest = hashlib.blake2b(blob, digest_size=16).digest()
+                old = previous.get(key)
+                stamp = old[1] if old and old[0] == digest else now
+                entries[key] = (blob, stamp)
+                written[key] = (digest, stamp)
+
+            if written == previous:
+                return
+            if not entries:
+                self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+                self._written.pop(user_id, None)
+                return
+
+            payload = zlib.compress(pickle.dumps(entries, protocol=pickle.HIGHEST_PROTOCOL))
+            self._conn.execute(
+                """
+                INSERT INTO user_data (user_id, payload, updated) VALUES (?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    payload = excluded.payload,
+                    updated = excluded.updated
+                """,
+                (user_id, payload, now),
+            )
+            self._written[user_id] = written
+
+    def _drop(self, user_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+            self._written.pop(user_id, None)
+
+    async def get_user_data(self) -> dict[int, dict]:
+        return await run_db(self._load)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        await run_db(self._store, user_id, self._serialise(user_id, data))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await run_db(self._drop, user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # ---------- NOT PERSISTED ----------
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data) -> None:
+        pass
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
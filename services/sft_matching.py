@@ -0,0 +1,154 @@
+import heapq
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.constants import SFT_MIN_PARTICIPANTS
+from services.db_service import SFTService, SFTSubmission
+from utils.time_utils import hhmm_to_minutes
+
+# How good a move is, best first: same activity elsewhere, then another
+# activity at the same location.
+SAME_ACTIVITY = 0
+SAME_LOCATION = 1
+
+
+def split_activity_key(key: str) -> Tuple[str, str]:
+    """Inverse of SFTSubmission.activity_key."""
+    activity, _, location = key.partition(" @ ")
+    return activity.strip(), location.strip()
+
+
+def _compatibility(source: str, target: str) -> Optional[int]:
+    source_activity, source_location = split_activity_key(source)
+    target_activity, target_location = split_activity_key(target)
+    if source_activity == target_activity:
+        return SAME_ACTIVITY
+    if source_location and source_location == target_location:
+        return SAME_LOCATION
+    return None
+
+
+# =========================
+# DATA MODELS
+# =========================
+
+@dataclass(frozen=True)
+class Proposal:
+    submission: SFTSubmission
+    target: str                    # activity key to move into
+    overlap_minutes: int
+    partners: Tuple[str, ...]      # names of overlapping cadets already in target
+
+    @property
+    def description(self) -> str:
+        s = self.submission
+        return (
+            f"Move {s.user_name} ({s.start}-{s.end}) from {s.activity_key} "
+            f"to {self.target}, overlapping {', '.join(self.partners)} "
+            f"for {self.overlap_minutes} min"
+        )
+
+
+@dataclass(frozen=True)
+class MatchPlan:
+    proposals: Tuple[Proposal, ...]
+    unmatched: Tuple[SFTSubmission, ...]   # under-filled with nowhere to go
+
+
+# =========================
+# MATCHING
+# =========================
+
+def _overlapping_pairs(submissions: List[SFTSubmission]) -> Iterator[Tuple[SFTSubmission, SFTSubmission, int]]:
+    """
+    Sweep over start times, keeping a heap of submissions still running.
+    Yields every overlapping pair once, with the overlap in minutes.
+    """
+    active: List[Tuple[int, int, SFTSubmission]] = []
+    ordered = sorted(submissions, key=lambda s: (hhmm_to_minutes(s.start), hhmm_to_minutes(s.end)))
+    for seq, submission in enumerate(ordered):
+        start = hhmm_to_minutes(submission.start)
+        end = hhmm_to_minutes(submission.end)
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for other_end, _, other in active:
+            yield submission, other, min(end, other_end) - start
+        heapq.heappush(active, (end, seq, submission))
+
+
+def propose_matches(window_id: int) -> MatchPlan:
+    """
+    Proposes moves that fill under-filled activities. A cadet in an activity
+    below SFT_MIN_PARTICIPANTS is moved into a compatible activity where
+    someone overlaps their time. Each cadet gets at most one proposal, and
+    nobody is moved into a group whose overlapping members are moving away.
+    """
+    headcounts = SFTService.headcounts(window_id)
+    underfilled = {key for key, count in headcounts.items() if count < SFT_MIN_PARTICIPANTS}
+    if not underfilled:
+        return MatchPlan(proposals=(), unmatched=())
+
+    submissions = SFTService.get_submissions(window_id)
+
+    # mover id -> target activity -> [(overlap, overlapping submission)]
+    candidates: Dict[int, Dict[str, list]] = defaultdict(dict)
+    movers: Dict[int, SFTSubmission] = {}
+    for a, b, overlap in _overlapping_pairs(submissions):
+        for mover, other in ((a, b), (b, a)):
+            source, target = mover.activity_key, other.activity_key
+            if source not in underfilled or source == target:
+                continue
+            if _compatibility(source, target) is None:
+                continue
+            movers[mover.id] = mover
+            candidates[mover.id].setdefault(target, []).append((overlap, other))
+
+    def target_rank(mover: SFTSubmission, target: str):
+        return (
+            _compatibility(mover.activity_key, target),
+            target in underfilled,          # established groups first
+            -max(overlap for overlap, _ in candidates[mover.id][target]),
+            -headcounts.get(target, 0),
+        )
+
+    ranked = []
+    for mover_id, targets in candidates.items():
+        mover = movers[mover_id]
+        ranked.append((min(target_rank(mover, t) for t in targets), mover))
+    ranked.sort(key=lambda item: (item[0], item[1].id))
+
+    moved = set()
+    anchored = set()    # partners someone is moving in with; they stay put
+    proposals = []
+    for _, mover in ranked:
+        if mover.id in anchored:
+            continue
+        for target in sorted(candidates[mover.id], key=lambda t: target_rank(mover, t)):
+            staying = [
+                (overlap, other) for overlap, other in candidates[mover.id][target]
+                if other.id not in moved
+            ]
+            if not staying:
+                continue
+            moved.add(mover.id)
+            anchored.update(other.id for _, other in staying)
+            proposals.append(Proposal(
+                submission=mover,
+                target=target,
+                overlap_minutes=max(overlap for overlap, _ in staying),
+                partners=tuple(dict.fromkeys(other.user_name for _, other in staying)),
+            ))
+            break
+
+    unmatched = tuple(
+        s for s in submissions
+        if s.activity_key in underfilled and s.id not in moved and s.id not in anchored
+    )
+    return MatchPlan(proposals=tuple(proposals), unmatched=unmatched)
+
+
+def apply_proposal(submission_id: int, target: str) -> bool:
+    """Blocking; run through run_db."""
+    activity, location = split_activity_key(target)
+    return SFTService.move_submission(submission_id, activity, location)
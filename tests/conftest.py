@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+os.environ.setdefault("BOT_TOKEN", "test-token")
+
+from db import database
+from db.database import SessionLocal, build_engine
+from db.models import Base
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Point every unit of work at a fresh SQLite file for one test."""
+    engine = build_engine(f"sqlite:///{tmp_path / 'bot.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal.configure(bind=engine)
+    yield engine
+    SessionLocal.configure(bind=database.engine)
+    engine.dispose()
@@ -0,0 +1,89 @@
+import io
+
+from db import crud
+from db.database import session_scope
+from db.import_users_csv import import_users, iter_import_users
+from db.models import User
+
+HEADER = "full_name,rank,role,telegram_id,telegram_username\n"
+
+
+def _csv(*rows):
+    return io.StringIO(HEADER + "".join(row + "\n" for row in rows))
+
+
+def _users():
+    with session_scope() as session:
+        return [
+            (user.full_name, user.rank, user.telegram_id, user.telegram_username)
+            for user in session.query(User).order_by(User.id)
+        ]
+
+
+def _drain(chunks):
+    result = None
+    for result in chunks:
+        pass
+    return result
+
+
+def test_repeated_rows_in_one_chunk_insert_once(db):
+    result = import_users(_csv(
+        "ALPHA,ME4T,cadet,1001,alpha",
+        "ALPHA TAN,ME4T,cadet,1001,",
+        "BRAVO,ME4T,cadet,,bravo",
+        "BRAVO LIM,ME4A,cadet,1002,bravo",
+    ))
+
+    assert (result["created"], result["updated"]) == (2, 2)
+    assert _users() == [
+        ("ALPHA TAN", "ME4T", 1001, "alpha"),
+        ("BRAVO LIM", "ME4A", 1002, "bravo"),
+    ]
+
+
+def test_repeated_rows_across_chunks_update_the_first_insert(db):
+    result = _drain(iter_import_users(_csv(
+        "ALPHA,ME4T,cadet,1001,",
+        "BRAVO,ME4T,cadet,,bravo",
+        "CHARLIE,ME4T,cadet,1003,",
+        "ALPHA TAN,ME4T,cadet,1001,alpha",
+        "BRAVO LIM,ME4T,cadet,1002,bravo",
+    ), chunk_size=2))
+
+    assert (result["processed"], result["created"], result["updated"]) == (5, 3, 2)
+    assert _users() == [
+        ("ALPHA TAN", "ME4T", 1001, "alpha"),
+        ("BRAVO LIM", "ME4T", 1002, "bravo"),
+        ("CHARLIE", "ME4T", 1003, None),
+    ]
+
+
+def test_existing_users_match_by_id_or_username(db):
+    crud.create_user(full_name="ALPHA", rank="ME4T", role="Cadet", telegram_id=1001)
+    crud.create_user(full_name="BRAVO", rank="ME4T", role="Cadet", telegram_username="bravo")
+
+    result = _drain(iter_import_users(_csv(
+        "ALPHA TAN,ME4T,cadet,1001,",
+        "BRAVO LIM,ME4T,cadet,1002,bravo",
+        "BRAVO LIM,ME4A,cadet,1002,",
+    ), chunk_size=1))
+
+    assert (result["created"], result["updated"]) == (0, 3)
+    # Blank identifiers never overwrite stored ones.
+    assert _users() == [
+        ("ALPHA TAN", "ME4T", 1001, None),
+        ("BRAVO LIM", "ME4A", 1002, "bravo"),
+    ]
+
+
+def test_invalid_rows_are_skipped_and_reported(db):
+    result = _drain(iter_import_users(_csv(
+        "ALPHA,ME4T,cadet,1001,",
+        "bravo,ME4T,cadet,1002,",
+        "CHARLIE,XYZ,cadet,1003,",
+    ), chunk_size=2))
+
+    assert (result["processed"], result["created"]) == (1, 1)
+    assert [line for line, _ in result["errors"]] == [3, 4]
+    assert _users() == [("ALPHA", "ME4T", 1001, None)]
@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+import pytest
+
+from db import crud
+from db.database import session_scope
+from db.parade import parade_aggregate
+from utils.datetime_utils import now_sg
+
+
+@pytest.fixture
+def today(db):
+    crud.create_user(full_name="ALPHA", rank="ME4T", role="cadet", telegram_id=1001)
+    crud.create_user(full_name="BRAVO", rank="ME4T", role="cadet", telegram_id=1002)
+    crud.create_user(full_name="CHARLIE", rank="ME4T", role="instructor", telegram_id=1003)
+    today = now_sg().date()
+    parade_aggregate.rebuild(today)
+    return today
+
+
+def _ids(snapshot):
+    events = {e.id for entries in snapshot.events.values() for e in entries}
+    statuses = {s.id for entries in snapshot.statuses.values() for s in entries}
+    return events, statuses
+
+
+def _assert_incremental_and_verified(today):
+    # Still current without a rebuild, and equal to a recompute from the DB.
+    assert parade_aggregate.peek_snapshot(today) is not None
+    assert parade_aggregate.verify(today)
+
+
+def test_records_events_and_statuses_as_they_commit(today):
+    rso = crud.create_user_record("ME4T ALPHA", "fever")
+    rsi = crud.create_rsi_record("ME4T BRAVO", "sprain")
+    ma = crud.create_ma_record("ME4T BRAVO", "Dental", "Clinic", today.strftime("%d%m%y"), "1400")
+    _assert_incremental_and_verified(today)
+    assert _ids(parade_aggregate.peek_snapshot(today)) == ({rso.id, rsi.id, ma.id}, set())
+
+    span = (today.strftime("%d%m%y"), (today + timedelta(days=1)).strftime("%d%m%y"))
+    crud.update_user_record(rso.id, "fever", "flu", "MC", *span)
+    crud.update_rsi_record(rsi.id, "sprain", "LD", "Light duty", *span)
+    _assert_incremental_and_verified(today)
+
+    events, statuses = _ids(parade_aggregate.peek_snapshot(today))
+    assert events == {ma.id}
+    assert len(statuses) == 2
+    assert parade_aggregate.peek_users_with_status(today) == {rso.user_id, rsi.user_id}
+
+
+def test_rolled_back_batch_leaves_aggregate_untouched(today):
+    kept = crud.create_user_record("ME4T ALPHA", "fever")
+    before = parade_aggregate.peek_snapshot(today)
+
+    with pytest.raises(RuntimeError):
+        with session_scope() as session:
+            crud.create_user_record("ME4T BRAVO", "cough", session=session)
+            crud.create_rsi_record("ME4T BRAVO", "sprain", session=session)
+            raise RuntimeError("batch failed")
+
+    _assert_incremental_and_verified(today)
+    assert parade_aggregate.peek_snapshot(today) == before
+    assert _ids(before) == ({kept.id}, set())
+
+
+def test_committed_batch_lands_at_once(today):
+    with session_scope() as session:
+        first = crud.create_user_record("ME4T ALPHA", "fever", session=session)
+        second = crud.create_rsi_record("ME4T BRAVO", "sprain", session=session)
+        # Nothing is visible until the batch commits.
+        assert _ids(parade_aggregate.peek_snapshot(today)) == (set(), set())
+
+    _assert_incremental_and_verified(today)
+    assert _ids(parade_aggregate.peek_snapshot(today)) == ({first.id, second.id}, set())
+
+
+def test_prune_mirrors_expired_deletes(today):
+    user_id = crud.create_user_record("ME4T ALPHA", "fever").user_id
+    old = crud.create_medical_event(
+        user_id, "RSO", "old cough", "", event_datetime=now_sg() - timedelta(days=10)
+    )
+    expired = crud.create_medical_status(
+        user_id, "MC", "MC", today - timedelta(days=5), today - timedelta(days=1), source_event_id=old.id
+    )
+    current = crud.create_user_record("ME4T BRAVO", "cough")
+    _assert_incremental_and_verified(today)
+
+    crud.delete_expired_statuses_and_events(today)
+    _assert_incremental_and_verified(today)
+    events, statuses = _ids(parade_aggregate.peek_snapshot(today))
+    assert old.id not in events and expired.id not in statuses
+    assert current.id in events
+
+
+def test_user_changes_invalidate_and_peek_never_rebuilds(today):
+    crud.create_user(full_name="DELTA", rank="ME4T", role="cadet", telegram_id=1004)
+
+    assert parade_aggregate.peek_snapshot(today) is None
+    assert parade_aggregate.peek_user_statuses([1], today) is None
+    assert parade_aggregate.snapshot(today).total_strength == 3
+    assert parade_aggregate.verify(today)
+
@@ -0,0 +1,109 @@
+import sqlite3
+
+import pytest
+
+from utils import rate_limiter
+from utils.rate_limiter import SQLiteBackend, UserRateLimiter
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "rate_limits.db")
+
+
+def test_spends_tokens_until_empty(clock, path):
+    backend = SQLiteBackend(path)
+
+    assert [backend.hit(1, "cb", 3, 30) for _ in range(4)] == [True, True, True, False]
+
+
+def test_refills_evenly_over_the_window(clock, path):
+    backend = SQLiteBackend(path)
+    for _ in range(3):
+        backend.hit(1, "cb", 3, 30)
+
+    clock.now += 9.9
+    assert not backend.hit(1, "cb", 3, 30)
+    clock.now += 0.2    # 10 s in total: one token back
+    assert backend.hit(1, "cb", 3, 30)
+    assert not backend.hit(1, "cb", 3, 30)
+
+    clock.now += 300    # refill never exceeds capacity
+    assert [backend.hit(1, "cb", 3, 30) for _ in range(4)] == [True, True, True, False]
+
+
+def test_rejected_hit_does_not_reset_refill(clock, path):
+    backend = SQLiteBackend(path)
+    backend.hit(1, "cb", 1, 10)
+
+    for _ in range(5):
+        clock.now += 1
+        assert not backend.hit(1, "cb", 1, 10)
+    clock.now += 5
+    assert backend.hit(1, "cb", 1, 10)
+
+
+def test_users_and_buckets_are_separate(clock, path):
+    backend = SQLiteBackend(path)
+
+    assert backend.hit(1, "cb", 1, 10)
+    assert not backend.hit(1, "cb", 1, 10)
+    assert backend.hit(2, "cb", 1, 10)
+    assert backend.hit(1, "import", 1, 10)
+
+
+def test_limits_are_shared_between_processes(clock, path):
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    assert first.hit(1, "cb", 2, 10)
+    assert second.hit(1, "cb", 2, 10)
+    assert not first.hit(1, "cb", 2, 10)
+
+
+def test_fails_open_while_another_writer_holds_the_lock(clock, path):
+    limiter = UserRateLimiter(SQLiteBackend(path))
+    assert limiter.allow(1, "cb", 1, 10)
+
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        assert limiter.allow(1, "cb", 1, 10)
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+    assert limiter.stats()["failed_open"] == 1
+    assert not limiter.allow(1, "cb", 1, 10)
+
+
+def test_sweep_drops_idle_rows_and_enforces_cap(clock, path):
+    backend = SQLiteBackend(path, max_keys=2)
+    backend.hit(1, "short", 5, 1)
+    clock.now += 1
+    for user_id in (2, 3, 4):
+        backend.hit(user_id, "long", 5, 60)
+        clock.now += 1
+
+    backend.sweep()
+    stats = backend.stats()
+    assert stats["keys"] == 2
+    assert stats["evicted"] == 2
+    # User 1's window has passed; user 2 is the least recently used live row.
+    with sqlite3.connect(path) as conn:
+        remaining = conn.execute("SELECT user_id FROM rate_limits ORDER BY user_id").fetchall()
+    assert remaining == [(3,), (4,)]
@@ -0,0 +1,108 @@
+import pytest
+
+from services.db_service import WINDOW_DATE_FORMAT, SFTService
+from services.sft_matching import apply_proposal, propose_matches, split_activity_key
+from utils.datetime_utils import now_sg
+
+DIS_RUN = "Running @ DIS Wing Approved Route"
+YELLOW_RUN = "Running @ Yellow Cluster Parade Square"
+FRISBEE = "Frisbee @ Basketball court"
+BASKETBALL = "Basketball @ Basketball court"
+GYM = "Gym @ Wingline"
+
+
+@pytest.fixture
+def window(db):
+    SFTService.load()
+    return SFTService.open_window(now_sg().strftime(WINDOW_DATE_FORMAT), "0700", "0900")
+
+
+def _submit(window, user_id, key, start, end):
+    activity, location = split_activity_key(key)
+    SFTService.add_submission(window.id, user_id, activity, location, start, end, f"CADET {user_id}")
+
+
+def _moves(plan):
+    return {(p.submission.user_id, p.target) for p in plan.proposals}
+
+
+def test_nothing_underfilled_proposes_nothing(window):
+    _submit(window, 1, GYM, "0700", "0800")
+    _submit(window, 2, GYM, "0700", "0800")
+
+    plan = propose_matches(window.id)
+    assert plan.proposals == ()
+    assert plan.unmatched == ()
+
+
+def test_prefers_same_activity_with_overlap(window):
+    _submit(window, 1, DIS_RUN, "0700", "0800")
+    _submit(window, 2, YELLOW_RUN, "0730", "0830")
+    _submit(window, 3, YELLOW_RUN, "0745", "0830")
+    _submit(window, 4, BASKETBALL, "0700", "0800")
+    _submit(window, 5, BASKETBALL, "0700", "0800")
+
+    [proposal] = propose_matches(window.id).proposals
+    assert (proposal.submission.user_id, proposal.target) == (1, YELLOW_RUN)
+    assert proposal.overlap_minutes == 30
+    assert proposal.partners == ("CADET 2", "CADET 3")
+
+
+def test_falls_back_to_same_location(window):
+    _submit(window, 1, FRISBEE, "0700", "0800")
+    _submit(window, 2, BASKETBALL, "0715", "0800")
+    _submit(window, 3, BASKETBALL, "0715", "0800")
+
+    assert _moves(propose_matches(window.id)) == {(1, BASKETBALL)}
+
+
+def test_no_overlap_or_compatible_activity_is_unmatched(window):
+    _submit(window, 1, DIS_RUN, "0700", "0730")
+    _submit(window, 2, YELLOW_RUN, "0800", "0900")
+    _submit(window, 3, YELLOW_RUN, "0800", "0900")
+    _submit(window, 4, GYM, "0700", "0800")
+
+    plan = propose_matches(window.id)
+    assert plan.proposals == ()
+    assert {s.user_id for s in plan.unmatched} == {1, 4}
+
+
+def test_two_singletons_pair_up_instead_of_swapping(window):
+    _submit(window, 1, DIS_RUN, "0700", "0800")
+    _submit(window, 2, YELLOW_RUN, "0730", "0830")
+
+    plan = propose_matches(window.id)
+    # One moves to the other, who stays put as the anchor.
+    assert len(plan.proposals) == 1
+    assert plan.unmatched == ()
+    [proposal] = plan.proposals
+    other = 2 if proposal.submission.user_id == 1 else 1
+    assert proposal.partners == (f"CADET {other}",)
+
+
+def test_apply_proposal_moves_submission(window):
+    _submit(window, 1, DIS_RUN, "0700", "0800")
+    _submit(window, 2, YELLOW_RUN, "0730", "0830")
+    _submit(window, 3, YELLOW_RUN, "0730", "0830")
+
+    [proposal] = propose_matches(window.id).proposals
+    assert apply_proposal(proposal.submission.id, proposal.target)
+
+    assert SFTService.headcounts(window.id) == {YELLOW_RUN: 3}
+    assert SFTService.occupancy(window.id)[YELLOW_RUN] == (1, 1, 3, 3, 2, 2, 0, 0)
+    assert propose_matches(window.id).proposals == ()
+
+    # Survives a reload from the DB.
+    SFTService.load()
+    assert SFTService.headcounts(window.id) == {YELLOW_RUN: 3}
+
+
+def test_apply_proposal_for_removed_submission_fails(window):
+    _submit(window, 1, DIS_RUN, "0700", "0800")
+    _submit(window, 2, YELLOW_RUN, "0730", "0830")
+    _submit(window, 3, YELLOW_RUN, "0730", "0830")
+
+    [proposal] = propose_matches(window.id).proposals
+    SFTService.remove_submission(1)
+    assert not apply_proposal(proposal.submission.id, proposal.target)
+    assert SFTService.headcounts(window.id) == {YELLOW_RUN: 2}
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from bot.commands import start_sft
+from db import crud
+from services.db_service import WINDOW_DATE_FORMAT, SFTService
+from utils.datetime_utils import now_sg
+
+
+class FakeMessage:
+    def __init__(self):
+        self.chat_id = 1
+        self.message_id = 1
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None, parse_mode=None):
+        self.replies.append((text, reply_markup))
+        return SimpleNamespace(chat_id=self.chat_id, message_id=self.message_id + len(self.replies))
+
+
+def _day(offset: int) -> str:
+    return (now_sg() + timedelta(days=offset)).strftime(WINDOW_DATE_FORMAT)
+
+
+def _start_sft():
+    message = FakeMessage()
+    update = SimpleNamespace(message=message, callback_query=None)
+    asyncio.run(start_sft(update, SimpleNamespace(user_data={})))
+    return message.replies
+
+
+@pytest.fixture
+def sft_db(db):
+    SFTService.load()
+
+
+def test_start_sft_hides_window_from_yesterday(sft_db):
+    SFTService.open_window(_day(-1), "0700", "0800")
+
+    [(text, markup)] = _start_sft()
+    assert "has not been opened" in text
+    assert markup is None
+
+
+def test_start_sft_shows_window_from_today(sft_db):
+    SFTService.open_window(_day(0), "0700", "0800")
+
+    [(text, markup)] = _start_sft()
+    assert "Select activity" in text
+    assert markup is not None
+
+
+def test_close_expired_closes_window_in_db(sft_db):
+    old = SFTService.open_window(_day(-1), "0700", "0800")
+    current = SFTService.open_window(_day(0), "0700", "0800")
+
+    assert [w.id for w in SFTService.close_expired()] == [old.id]
+    SFTService.load()
+    assert [w.id for w in SFTService.open_windows()] == [current.id]
+
+
+def test_load_closes_windows_from_previous_days(sft_db):
+    old = SFTService.open_window(_day(-1), "0700", "0800")
+
+    SFTService.load()
+    assert SFTService.get_window(old.id) is None
+    assert SFTService.close_expired() == []
+
+
+def test_clear_user_data_drops_sft_submissions(sft_db):
+    window = SFTService.open_window(_day(0), "0700", "0800")
+    user = crud.create_user(full_name="ALPHA", rank="ME4T", role="cadet", telegram_id=1001)
+    SFTService.add_submission(window.id, user.id, "Run", "Track", "0700", "0730", "ME4T ALPHA")
+
+    assert crud.clear_user_data()["sft_submissions"] == 1
+    SFTService.load()
+    assert SFTService.get_submissions(window.id) == []
+
+    # The reimported user gets the same id but none of the old submissions.
+    again = crud.create_user(full_name="ZULU", rank="ME4T", role="cadet", telegram_id=1002)
+    assert again.id == user.id
+    assert not SFTService.remove_submission(again.id)
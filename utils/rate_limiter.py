@@ -1,26 +1,263 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
 import time
+from collections import Counter, OrderedDict
+from pathlib import Path
 
-class UserRateLimiter:
+logger = logging.getLogger(__name__)
 
-    def __init__(self):
-        self._events: dict[tuple[int, str], list[float]] = {}
+# Hard cap on tracked (user, bucket) pairs; the least recently used go first.
+MAX_TRACKED_KEYS = 10_000
 
-    def allow(self, user_id: int | None, bucket: str, max_requests: int, window_seconds: int) -> bool:
-        if user_id is None:
-            return False
+# Seconds between sweeps of idle rows in the shared SQLite backend.
+SQLITE_SWEEP_INTERVAL_SECONDS = 60
+
+# How long a hit waits for another process's write lock before failing open.
+SQLITE_BUSY_TIMEOUT_MS = 5
+
+# The sweep runs off the event loop, so it can afford to wait.
+SQLITE_SWEEP_BUSY_TIMEOUT_MS = 5000
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower() or "memory"
+RATE_LIMIT_DB_PATH = os.getenv(
+    "RATE_LIMIT_DB_PATH",
+    str(Path(__file__).resolve().parents[1] / "rate_limits.db"),
+)
+
+
+# =========================
+# BACKENDS
+# =========================
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "window")
+
+    def __init__(self, tokens: float, updated: float, window: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.window = window
+
+
+class MemoryBackend:
+    """
+    Token buckets in this process. Keys live in LRU order; a key idle for a
+    whole window is back to a full bucket, so dropping it loses nothing.
+    """
 
+    name = "memory"
+
+    def __init__(self, max_keys: int = MAX_TRACKED_KEYS):
+        self._max_keys = max_keys
+        self._buckets: OrderedDict[tuple[int, str], _Bucket] = OrderedDict()
+        self._evicted = 0
+
+    def hit(self, user_id: int, bucket: str, max_requests: int, window_seconds: int) -> bool:
         now = time.monotonic()
-        cutoff = now - window_seconds
         key = (user_id, bucket)
-        timestamps = self._events.get(key, [])
-        timestamps = [ts for ts in timestamps if ts >= cutoff]
+        state = self._buckets.get(key)
+
+        if state is None:
+            self._evict_idle(now)
+            if len(self._buckets) >= self._max_keys:
+                self._buckets.popitem(last=False)
+                self._evicted += 1
+            state = _Bucket(float(max_requests), now, window_seconds)
+            self._buckets[key] = state
+        else:
+            self._buckets.move_to_end(key)
+            refill = (now - state.updated) * max_requests / window_seconds
+            state.tokens = min(float(max_requests), state.tokens + refill)
+            state.updated = now
+            state.window = window_seconds
 
-        if len(timestamps) >= max_requests:
-            self._events[key] = timestamps
+        if state.tokens < 1:
             return False
 
-        timestamps.append(now)
-        self._events[key] = timestamps
+        state.tokens -= 1
         return True
 
-user_rate_limiter = UserRateLimiter()
\ No newline at end of file
+    def _evict_idle(self, now: float):
+        # Oldest first; stop at the first key still inside its window.
+        while self._buckets:
+            key, state = next(iter(self._buckets.items()))
+            if now - state.updated < state.window:
+                return
+            del self._buckets[key]
+            self._evicted += 1
+
+    def sweep(self):
+        """Idle keys already go on the next new key, so there is nothing to do."""
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._buckets),
+            "max_keys": self._max_keys,
+            "evicted": self._evicted,
+        }
+
+
+class SQLiteBackend:
+    """
+    Token buckets in a SQLite file shared by every worker process, so limits
+    hold across processes and restarts. Each hit is one atomic upsert that
+    only spends a token when one is available; rowcount says whether it did.
+    Uses wall-clock time, since monotonic clocks differ between processes.
+
+    hit() runs on the event loop, so it waits at most SQLITE_BUSY_TIMEOUT_MS
+    for the write lock and lets the request through if the DB stays busy.
+    Idle rows are swept off the loop, on a connection of their own.
+    """
+
+    name = "sqlite"
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            user_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL,
+            window_seconds REAL NOT NULL,
+            PRIMARY KEY (user_id, bucket)
+        ) WITHOUT ROWID
+    """
+
+    _HIT = """
+        INSERT INTO rate_limits (user_id, bucket, tokens, updated, window_seconds)
+        VALUES (:user_id, :bucket, :capacity - 1, :now, :window)
+        ON CONFLICT (user_id, bucket) DO UPDATE SET
+            tokens = min(:capacity, tokens + max(:now - updated, 0) * :capacity / :window) - 1,
+            updated = :now,
+            window_seconds = :window
+        WHERE min(:capacity, tokens + max(:now - updated, 0) * :capacity / :window) >= 1
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH, max_keys: int = MAX_TRACKED_KEYS):
+        self._path = path
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._sweep_conn = None
+        self._evicted = 0
+        self._failed_open = 0
+        self._conn = self._connect(SQLITE_BUSY_TIMEOUT_MS)
+        self._conn.execute(self._SCHEMA)
+
+    def _connect(self, busy_timeout_ms: int) -> sqlite3.Connection:
+        # Autocommit: every statement is its own atomic transaction.
+        conn = sqlite3.connect(self._path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        return conn
+
+    def hit(self, user_id: int, bucket: str, max_requests: int, window_seconds: int) -> bool:
+        now = time.time()
+        with self._lock:
+            try:
+                cursor = self._conn.execute(self._HIT, {
+                    "user_id": user_id,
+                    "bucket": bucket,
+                    "capacity": float(max_requests),
+                    "window": float(window_seconds),
+                    "now": now,
+                })
+            except sqlite3.OperationalError:
+                # Locked or unavailable: a missed limit beats a stalled bot.
+                self._failed_open += 1
+                return True
+            return cursor.rowcount == 1
+
+    def sweep(self):
+        """Drop idle rows and enforce max_keys. Blocking; keep it off the event loop."""
+        with self._sweep_lock:
+            if self._sweep_conn is None:
+                self._sweep_conn = self._connect(SQLITE_SWEEP_BUSY_TIMEOUT_MS)
+            conn = self._sweep_conn
+            now = time.time()
+            deleted = conn.execute(
+                "DELETE FROM rate_limits WHERE updated + window_seconds <= ?", (now,)
+            ).rowcount
+            # The cap is enforced here, so it can overshoot between sweeps.
+            (count,) = conn.execute("SELECT count(*) FROM rate_limits").fetchone()
+            if count > self._max_keys:
+                deleted += conn.execute(
+                    """
+                    DELETE FROM rate_limits WHERE (user_id, bucket) IN (
+                        SELECT user_id, bucket FROM rate_limits ORDER BY updated LIMIT ?
+                    )
+                    """,
+                    (count - self._max_keys,),
+                ).rowcount
+            self._evicted += deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT count(*) FROM rate_limits").fetchone()
+        return {
+            "keys": count,
+            "max_keys": self._max_keys,
+            "evicted": self._evicted,
+            "failed_open": self._failed_open,
+        }
+
+
+RATE_LIMIT_BACKENDS = {
+    MemoryBackend.name: MemoryBackend,
+    SQLiteBackend.name: SQLiteBackend,
+}
+
+
+# =========================
+# LIMITER
+# =========================
+
+class UserRateLimiter:
+    """
+    Token bucket per (user, bucket): max_requests tokens, refilled evenly over
+    window_seconds. Where the buckets live is up to the backend.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend or MemoryBackend()
+        self._rejections: Counter[str] = Counter()
+
+    def allow(self, user_id: int | None, bucket: str, max_requests: int, window_seconds: int) -> bool:
+        if user_id is None:
+            return False
+
+        if self._backend.hit(user_id, bucket, max_requests, window_seconds):
+            return True
+
+        self._rejections[bucket] += 1
+        return False
+
+    def sweep(self):
+        self._backend.sweep()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self._backend.name,
+            **self._backend.stats(),
+            "rejections": dict(self._rejections),
+        }
+
+
+def build_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> UserRateLimiter:
+    if backend not in RATE_LIMIT_BACKENDS:
+        raise ValueError(
+            f"Unknown RATE_LIMIT_BACKEND {backend!r}; expected one of {sorted(RATE_LIMIT_BACKENDS)}"
+        )
+    return UserRateLimiter(RATE_LIMIT_BACKENDS[backend]())
+
+
+user_rate_limiter = build_rate_limiter()
+
+
+async def sweep_rate_limits_job(context):
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, user_rate_limiter.sweep)
+    except sqlite3.OperationalError:
+        logger.warning("Rate limit sweep skipped; database busy", exc_info=True)
@@ -4,6 +4,7 @@ from db.crud import delete_expired_statuses_and_events
 from utils.datetime_utils import SG_TZ, now_sg
 
 DAILY_MSG_TIME = time(hour=8, minute=0)
+SFT_EXPIRE_TIME = time(hour=0, minute=0)
 
 
 def today_sg() -> str:
@@ -18,6 +19,10 @@ def now_hhmm() -> str:
     return now_sg().strftime("%H%M")
 
 
+def hhmm_to_minutes(value: str) -> int:
+    return int(value[:2]) * 60 + int(value[2:])
+
+
 def is_valid_24h_time(value: str) -> bool:
     return bool(re.fullmatch(r"([01][0-9]|2[0-3])[0-5][0-9]", value))
 